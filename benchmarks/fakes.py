@@ -0,0 +1,188 @@
+import time
+import random
+import threading
+import requests
+from google.genai import types
+
+class FakeServiceError(Exception):
+    """代替サービスが failure_rate に従って発生させるエラー。"""
+
+
+class FakeBehavior:
+    """代替サービス共通の応答遅延と失敗率。"""
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def simulate(self, label):
+        with self._lock:
+            self.calls += 1
+            fail = self.failure_rate and self.random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeServiceError(f"{label}: simulated failure")
+
+
+def make_summary_text(postings, offset=0):
+    """
+    summary_client の出力と同じ形式の要約テキストを作ります。
+    offset をずらすと会社名の一部が重なるテキストになります（複数クエリの重複除去の確認用）。
+    """
+    lines = ["🏢 本日のデータサイエンス系障がい者求人はこちらです：", ""]
+    for i in range(1, postings + 1):
+        lines += [
+            f"{i}. 🏢 株式会社ベンチマーク{i + offset:05d}",
+            "    📍 勤務地: 東京都港区（リモート可）",
+            "    💼 職種: データサイエンティスト",
+            "    💰 給与: 年収500万円～700万円",
+            "    ⏰ 勤務形態: 正社員",
+            "    🔍 特徴: 障害者雇用実績あり。フレックスタイム制。",
+            "",
+        ]
+    return "\n".join(lines)
+
+def make_response(text, grounding_chunks=0, url_prefix="https://fake.example/redirect"):
+    """grounding_metadata とトークン数付きの GenerateContentResponse を作ります。"""
+    chunks = [
+        types.GroundingChunk(web=types.GroundingChunkWeb(uri=f"{url_prefix}/{i}", title=f"page {i}"))
+        for i in range(grounding_chunks)
+    ]
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            grounding_metadata=types.GroundingMetadata(grounding_chunks=chunks) if chunks else None,
+        )],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=1000,
+            candidates_token_count=max(1, len(text) // 2),
+            total_token_count=1000 + max(1, len(text) // 2),
+        ),
+    )
+
+
+class FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        self.client.behavior.simulate("generate_content")
+        return make_response(self.client.respond(contents, config), self.client.chunks_for(config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        """応答テキストを行ごとのチャンクに分けて返します。最初のチャンクまでに latency だけ待ちます。"""
+        self.client.behavior.simulate("generate_content_stream")
+        lines = self.client.respond(contents, config).splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            last = i == len(lines) - 1
+            response = make_response(line, self.client.chunks_for(config) if last else 0)
+            if not last:
+                response.usage_metadata = None
+            yield response
+
+
+class FakeChat:
+    def __init__(self, client, model, config):
+        self.client = client
+        self.model = model
+        self.config = config
+        self.history = []
+
+    def get_history(self, curated=False):
+        return list(self.history)
+
+    def record_history(self, user_input, model_output, is_valid):
+        self.history.append(user_input)
+        self.history.extend(model_output)
+
+    def send_message(self, message, config=None):
+        self.client.behavior.simulate("send_message")
+        response = make_response(self.client.respond(message, self.config), self.client.chunks_for(self.config))
+        self.record_history(types.UserContent(parts=[types.Part(text=message)]),
+                            [response.candidates[0].content], True)
+        return response
+
+
+class FakeChats:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model, config=None):
+        return FakeChat(self.client, model, config)
+
+
+class FakeGeminiClient:
+    """
+    genai.Client の代替。models.generate_content(_stream) と chats.create(...).send_message を提供します。
+    google_search ツール付きのリクエストには grounding_chunks 件の参照を付けて返します。
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0, grounding_chunks=10, postings=5, seed=None):
+        self.behavior = FakeBehavior(latency, failure_rate, seed)
+        self.grounding_chunks = grounding_chunks
+        self.postings = postings
+        self.models = FakeModels(self)
+        self.chats = FakeChats(self)
+
+    def chunks_for(self, config):
+        tools = (config or {}).get("tools", []) if isinstance(config, dict) else []
+        return self.grounding_chunks if tools else 0
+
+    def respond(self, contents, config):
+        if "求人情報の各案件を分かりやすく整理し" in str(contents):
+            return make_summary_text(self.postings)
+        if "各求人は次の形式で" in str(contents):
+            # 複数クエリの並列検索。クエリごとに会社名を少しずつずらして一部を重複させる
+            return make_summary_text(self.postings, offset=sum(map(ord, str(contents))) % self.postings)
+        return "企業名：株式会社ベンチマーク\n🏢 企業概要：\n    - 事業内容：データ活用サービス\n" * 3
+
+
+class FakeResponse:
+    """requests.Response のうちこのボットが使う属性だけを持つ代替。"""
+    def __init__(self, url, status_code=200, body=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {"Content-Type": "text/html; charset=utf-8"}
+        self.encoding = "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def iter_content(self, chunk_size=1024):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeWebSession:
+    """
+    参照サイト取得用 requests.Session の代替。
+    リダイレクト URL を最終 URL に置き換え、page_size バイトの HTML を返します。
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0, page_size=200_000, seed=None):
+        self.behavior = FakeBehavior(latency, failure_rate, seed)
+        filler = "<script>var x = 1;</script>\n" * (page_size // 28)
+        self.page = (
+            "<html><head><meta charset=\"utf-8\"><title>ベンチマーク求人ページ</title>"
+            f"{filler}</head><body></body></html>"
+        ).encode("utf-8")
+
+    def get(self, url, allow_redirects=True, timeout=None, stream=False, **kwargs):
+        if timeout is not None and self.behavior.latency > timeout:
+            # requests と同様、応答が timeout 秒以内に来なければ打ち切る
+            time.sleep(timeout)
+            raise requests.Timeout(f"{url}: timed out after {timeout:.2f}s")
+        self.behavior.simulate("http_get")
+        return FakeResponse(url.replace("/redirect/", "/page/"), 200, self.page)
@@ -0,0 +1,199 @@
+"""
+Gemini・Slack・参照サイトをローカルの代替に差し替えて、要約と企業分析の処理時間を計測するベンチマーク。
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --quick
+
+結果は JSON で出力されるため、コミット間で比較できます。
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from benchmarks.fakes import FakeGeminiClient, FakeWebSession
+from src.analysis_store import SqliteAnalysisStore
+from src.company_recruit_analysis import CompanyRecruitAnalysis
+from src.gemini_slack_poster import GeminiSlackPoster
+from src.instrumentation import Tracer
+from src.slack_client import SlackClient
+from src.slack_stub_server import SlackStubServer
+
+CHANNELS = ["CBENCH1", "CBENCH2"]
+
+@contextlib.contextmanager
+def workspace():
+    """data/ 配下への書き込みがリポジトリに残らないよう、一時ディレクトリで実行します。"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="recruit-bench-") as tmp:
+        os.makedirs(os.path.join(tmp, "data"))
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+def company_name(kind, i):
+    """
+    ベンチマーク用の会社名を返します。連番だけが異なる名前は名寄せの対象になりうるため、
+    連番のハッシュから作った互いに似ていない名前にします。
+    """
+    return f"株式会社{kind}{hashlib.sha1(f'{kind}{i}'.encode()).hexdigest()[:12].upper()}"
+
+def make_req_text(postings, known_companies):
+    """
+    postings 件の求人テキストを作ります。先頭 known_companies 件はストアに登録済みの会社、
+    残りが未分析の会社です（既存分の走査が最も長くなる配置）。
+    """
+    jobs = []
+    for i in range(postings):
+        name = company_name("既存", i) if i < known_companies else company_name("新規", i)
+        jobs.append(
+            f"{i + 1}. 🏢 {name}\n"
+            "    📍 勤務地: 東京都港区\n"
+            "    💼 職種: データサイエンティスト\n"
+            "    🔍 特徴: 障害者雇用実績あり。"
+        )
+    return "\n\n".join(jobs)
+
+def populate_store(store, size):
+    timestamp = datetime.now(ZoneInfo("Asia/Tokyo")).isoformat()
+    store.save_many({
+        company_name("既存", i): {"analysis": "企業概要：ベンチマーク用の分析結果。" * 20, "timestamp": timestamp}
+        for i in range(size)
+    })
+
+def timed(func):
+    """標準出力を捨てて func を実行し、(経過秒, 例外メッセージ) を返します。"""
+    start = time.perf_counter()
+    error = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            func()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, error
+
+def bench_summary(slack_server, chunks, gemini_latency, web_latency, failure_rate, stream=False, variants=1):
+    with workspace():
+        tracer = Tracer("summary")
+        poster = GeminiSlackPoster(
+            "fake-key", "xoxb-fake", CHANNELS,
+            reference_cache_file=None,
+            slack_client=SlackClient("xoxb-fake", CHANNELS, base_url=slack_server.url,
+                                     backoff_base=0.01, tracer=tracer),
+            tracer=tracer,
+            gemini_client=FakeGeminiClient(latency=gemini_latency, grounding_chunks=chunks, seed=1),
+            stream=stream,
+        )
+        poster.session = FakeWebSession(latency=web_latency, failure_rate=failure_rate, seed=1)
+        queries = [f"ベンチマーク用のクエリ{i}" for i in range(variants)]
+        wall, error = timed(lambda: poster.post_search_result(queries[0] if variants == 1 else queries))
+        return wall, error, tracer.summarize(), {}
+
+def bench_analysis(slack_server, store_size, postings, gemini_latency, batch, concurrency=3, stream=False):
+    with workspace():
+        tracer = Tracer("analysis")
+        analyzer = CompanyRecruitAnalysis(
+            "fake-key", "xoxb-fake", CHANNELS,
+            slack_client=SlackClient("xoxb-fake", CHANNELS, base_url=slack_server.url,
+                                     backoff_base=0.01, tracer=tracer),
+            tracer=tracer,
+            gemini_client=FakeGeminiClient(latency=gemini_latency, seed=1),
+            stream=stream,
+        )
+        known = min(store_size, postings - (concurrency if batch else 1))
+        req_text = make_req_text(postings, known)
+        with SqliteAnalysisStore(os.path.join("data", "analysis_results.db")) as store:
+            populate_store(store, store_size)
+            before = len(store)
+            if batch:
+                run = lambda: analyzer.run_analysis_batch(req_text, store, max_companies=concurrency,
+                                                          concurrency=concurrency)
+            else:
+                run = lambda: analyzer.run_analysis_for_one(req_text, store)
+            wall, error = timed(run)
+            # 名寄せの誤判定などで分析対象が減ると並列度の計測にならないため、件数も結果に残す
+            analyzed = len(store) - before
+        return wall, error, tracer.summarize(), {"analyzed_companies": analyzed}
+
+def scenarios(quick):
+    if quick:
+        return [
+            ("summary", dict(chunks=10, gemini_latency=0.05, web_latency=0.02, failure_rate=0.0)),
+            ("summary", dict(chunks=10, gemini_latency=0.05, web_latency=0.02, failure_rate=0.0, stream=True)),
+            ("summary", dict(chunks=10, gemini_latency=0.05, web_latency=0.02, failure_rate=0.0, variants=3)),
+            ("analysis_one", dict(store_size=1000, postings=200, gemini_latency=0.05, batch=False)),
+            ("analysis_one", dict(store_size=1000, postings=200, gemini_latency=0.05, batch=False, stream=True)),
+            ("analysis_batch", dict(store_size=1000, postings=200, gemini_latency=0.05, batch=True)),
+        ]
+    return [
+        ("summary", dict(chunks=10, gemini_latency=0.5, web_latency=0.2, failure_rate=0.0)),
+        ("summary", dict(chunks=10, gemini_latency=0.5, web_latency=0.2, failure_rate=0.0, stream=True)),
+        ("summary", dict(chunks=10, gemini_latency=0.5, web_latency=0.2, failure_rate=0.0, variants=3)),
+        ("summary", dict(chunks=100, gemini_latency=0.5, web_latency=0.2, failure_rate=0.05)),
+        ("summary", dict(chunks=300, gemini_latency=0.5, web_latency=0.2, failure_rate=0.1)),
+        ("analysis_one", dict(store_size=10_000, postings=2_000, gemini_latency=0.5, batch=False)),
+        ("analysis_one", dict(store_size=10_000, postings=5_000, gemini_latency=0.5, batch=False)),
+        ("analysis_batch", dict(store_size=10_000, postings=5_000, gemini_latency=0.5, batch=True)),
+    ]
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="規模を小さくして短時間で実行する")
+    parser.add_argument("--repeat", type=int, default=1, help="各シナリオの繰り返し回数")
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="Slack 代替サーバーの応答遅延（秒）")
+    parser.add_argument("--output", help="結果 JSON の出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    results = []
+    with SlackStubServer(latency=args.slack_latency, rate_limit_every=7, retry_after=0) as slack_server:
+        for name, params in scenarios(args.quick):
+            for run in range(args.repeat):
+                if name == "summary":
+                    wall, error, stages, extra = bench_summary(slack_server, **params)
+                else:
+                    wall, error, stages, extra = bench_analysis(slack_server, **params)
+                results.append({
+                    "scenario": name,
+                    "run": run,
+                    "params": params,
+                    "wall_s": round(wall, 4),
+                    "error": error,
+                    **extra,
+                    "stages": stages,
+                })
+                print(f"{name:<16}{json.dumps(params, ensure_ascii=False):<90}{wall:>9.3f}s"
+                      + (f"  ❌ {error}" if error else ""), file=sys.stderr)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now(ZoneInfo("Asia/Tokyo")).isoformat(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import os
+import re
+import sys
+import math
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+from src.analysis_store import ANALYSIS_STORE_FILE, open_analysis_store
+
+ANALYSIS_SEARCH_INDEX_FILE = "data/analysis_search.db"  # 企業分析の全文検索インデックス（文字 bigram）
+
+TOKEN_SPLIT_RE = re.compile(r"[\s、。，．,.!?！？・:：;；()（）\[\]「」『』【】\"'“”‘’/\\|-]+")
+QUERY_OPERATORS = {"or", "and", "|"}
+
+def normalize_text(text):
+    return unicodedata.normalize("NFKC", text).lower()
+
+def bigrams(text):
+    """
+    テキストを記号・空白で区切り、各区間の文字 bigram を返します（1文字の区間はそのまま）。
+    日本語は単語の区切りがないため、形態素解析の代わりに文字 bigram を索引語にします。
+    """
+    grams = []
+    for run in TOKEN_SPLIT_RE.split(normalize_text(text)):
+        if len(run) == 1:
+            grams.append(run)
+        else:
+            grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+def parse_query(query):
+    """「フルリモート or 法定雇用率」のような検索語を語のリストに分解します。"""
+    return [term for term in normalize_text(query).split() if term not in QUERY_OPERATORS]
+
+def make_snippet(text, terms, width=40):
+    """最初に見つかった検索語の前後 width 文字を抜き出します。"""
+    normalized = normalize_text(text)
+    positions = [normalized.find(term) for term in terms if normalized.find(term) >= 0]
+    if not positions:
+        return text[:width * 2].replace("\n", " ") + ("…" if len(text) > width * 2 else "")
+    start = max(0, min(positions) - width)
+    end = min(len(text), min(positions) + width)
+    snippet = text[start:end].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+@dataclass
+class SearchHit:
+    """検索結果の1件。"""
+    company_name: str
+    score: float
+    snippet: str
+    matched_terms: list
+
+
+class AnalysisSearchIndex:
+    """
+    企業分析テキストの文字 bigram 転置インデックス（SQLite に永続化）。
+    分析結果が保存されるたびに add() でその1件だけを索引に反映し、全件の再走査は行いません。
+    検索は BM25 で順位付けします。
+    """
+    def __init__(self, path=ANALYSIS_SEARCH_INDEX_FILE, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " company_name TEXT UNIQUE NOT NULL,"
+            " length INTEGER NOT NULL"
+            ");"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " doc_id INTEGER NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, doc_id)"
+            ") WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);"
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def __contains__(self, company_name):
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM docs WHERE company_name = ?", (company_name,)).fetchone()
+        return row is not None
+
+    def add(self, company_name, text):
+        """1件の分析テキストを索引に追加します（既にある場合は置き換え）。"""
+        terms = Counter(bigrams(company_name + "\n" + text))
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT doc_id FROM docs WHERE company_name = ?", (company_name,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+                self.conn.execute("UPDATE docs SET length = ? WHERE doc_id = ?", (sum(terms.values()), row[0]))
+                doc_id = row[0]
+            else:
+                cursor = self.conn.execute("INSERT INTO docs (company_name, length) VALUES (?, ?)",
+                                           (company_name, sum(terms.values())))
+                doc_id = cursor.lastrowid
+            self.conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                                  [(term, doc_id, tf) for term, tf in terms.items()])
+
+    def sync(self, store):
+        """store にあって索引にない分析結果だけを追加し、追加件数を返します。"""
+        with self._lock:
+            indexed = {row[0] for row in self.conn.execute("SELECT company_name FROM docs")}
+        added = 0
+        for company_name in store.keys():
+            if company_name in indexed:
+                continue
+            record = store.get(company_name)
+            if record:
+                self.add(company_name, record.get("analysis", ""))
+                added += 1
+        return added
+
+    def search(self, query, limit=10, store=None):
+        """
+        query に関連する企業を BM25 のスコア順に返します。
+        store を渡すと分析テキストから検索語の前後を抜き出したスニペットを付けます。
+        """
+        terms = parse_query(query)
+        query_grams = Counter(g for term in terms for g in bigrams(term))
+        if not query_grams:
+            return []
+        with self._lock:
+            n_docs, avg_length = self.conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            scores = Counter()
+            for gram, weight in query_grams.items():
+                rows = self.conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id"
+                    " WHERE p.term = ?", (gram,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += weight * idf * tf * (self.k1 + 1) / (tf + norm)
+            top = scores.most_common(limit)
+            names = dict(self.conn.execute(
+                f"SELECT doc_id, company_name FROM docs WHERE doc_id IN ({','.join('?' * len(top))})",
+                [doc_id for doc_id, _ in top]
+            ).fetchall()) if top else {}
+
+        hits = []
+        for doc_id, score in top:
+            company_name = names[doc_id]
+            text = ""
+            if store is not None:
+                record = store.get(company_name)
+                text = record.get("analysis", "") if record else ""
+            normalized = normalize_text(company_name + "\n" + text)
+            hits.append(SearchHit(
+                company_name=company_name,
+                score=round(score, 4),
+                snippet=make_snippet(text, terms) if text else "",
+                matched_terms=[term for term in terms if term in normalized],
+            ))
+        return hits
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_hits(query, hits, elapsed_ms=None):
+    timing = f"（{elapsed_ms:.1f} ms）" if elapsed_ms is not None else ""
+    print(f"🔎 「{query}」の検索結果: {len(hits)} 件{timing}")
+    for i, hit in enumerate(hits, start=1):
+        matched = "、".join(hit.matched_terms) if hit.matched_terms else "部分一致"
+        print(f"{i}. {hit.company_name}  (score: {hit.score:.2f} / 一致: {matched})")
+        if hit.snippet:
+            print(f"    {hit.snippet}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search over company analyses")
+    parser.add_argument("command", choices=["build", "search"],
+                        help="build: ストアの未索引分を索引に追加、search: 検索")
+    parser.add_argument("query", nargs="?", help="検索語（空白区切り・or 可）")
+    parser.add_argument("--store", default=ANALYSIS_STORE_FILE, help="分析結果のストア（.db または .json）")
+    parser.add_argument("--index", default=ANALYSIS_SEARCH_INDEX_FILE, help="検索インデックスのファイル")
+    parser.add_argument("--limit", type=int, default=10, help="表示する件数")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        print(f"❌ ファイル {args.store} が見つかりません。")
+        sys.exit(1)
+    with open_analysis_store(args.store) as store, AnalysisSearchIndex(args.index) as index:
+        added = index.sync(store)
+        if args.command == "build":
+            print(f"✅ {added} 件を索引に追加しました（合計 {len(index)} 件）。")
+            return
+        if not args.query:
+            print("❌ 検索語を指定してください。")
+            sys.exit(1)
+        hits = index.search(args.query, limit=args.limit, store=store)
+        print_hits(args.query, hits)
+
+if __name__ == "__main__":
+    main()
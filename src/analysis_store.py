@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import argparse
+import threading
+
+ANALYSIS_STORE_FILE = "data/analysis_results.db"      # 企業分析結果のインデックス付きストア（SQLite）
+ANALYSIS_JSON_FILE = "data/analysis_results.json"     # 従来の JSON 形式の企業分析結果
+ANALYSIS_LOG_FILE = "data/analysis_log.jsonl"         # ストアへの書き込みを1行1件で追記するログ（コミット用）
+
+class AnalysisStore:
+    """
+    企業分析結果の保存先の共通インターフェース。
+    会社名をキーとして {"analysis": ..., "timestamp": ...} のレコードを保存します。
+    """
+    def __contains__(self, company_name):
+        raise NotImplementedError
+
+    def get(self, company_name):
+        raise NotImplementedError
+
+    def save(self, company_name, record):
+        self.save_many({company_name: record})
+
+    def save_many(self, records):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def items(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return sum(1 for _ in self.keys())
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonAnalysisStore(AnalysisStore):
+    """
+    従来の data/analysis_results.json をそのまま読み書きするストア。
+    全件をメモリに読み込み、保存時はファイル全体を書き直します（移行・エクスポート用）。
+    """
+    def __init__(self, path=ANALYSIS_JSON_FILE):
+        self.path = path
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.results = json.load(f)
+
+    def __contains__(self, company_name):
+        return company_name in self.results
+
+    def get(self, company_name):
+        return self.results.get(company_name)
+
+    def save_many(self, records):
+        self.results.update(records)
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".analysis_results.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.results, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def keys(self):
+        return iter(self.results.keys())
+
+    def items(self):
+        return iter(self.results.items())
+
+    def __len__(self):
+        return len(self.results)
+
+
+class SqliteAnalysisStore(AnalysisStore):
+    """
+    会社名を主キーとする SQLite ストア。
+    存在確認は主キーのインデックスで行い、分析本文は必要になるまで読み込みません。
+    書き込みは1件（または1バッチ）ごとのトランザクションで、途中で中断しても壊れません。
+    log_file を指定すると、保存した記録を JSONL のログにも追記します（ワークフローではバイナリの .db ではなく
+    このログをコミットし、次回の実行で replay_analysis_log によりストアを復元します）。
+    """
+    def __init__(self, path=ANALYSIS_STORE_FILE, log_file=None):
+        self.path = path
+        self.log_file = log_file
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " company_name TEXT PRIMARY KEY,"
+            " analysis TEXT NOT NULL,"
+            " timestamp TEXT"
+            ")"
+        )
+        self.conn.commit()
+
+    def __contains__(self, company_name):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM analyses WHERE company_name = ?", (company_name,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, company_name):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT analysis, timestamp FROM analyses WHERE company_name = ?", (company_name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"analysis": row[0], "timestamp": row[1]}
+
+    def save_many(self, records):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO analyses (company_name, analysis, timestamp) VALUES (?, ?, ?)",
+                [(name, r["analysis"], r.get("timestamp")) for name, r in records.items()]
+            )
+        if self.log_file:
+            append_analysis_log(records, self.log_file)
+
+    def keys(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT company_name FROM analyses ORDER BY rowid").fetchall()
+        return iter(row[0] for row in rows)
+
+    def items(self):
+        # 本文を含むため全件を一度に読み込まず、カーソルから順に返す
+        cursor = self.conn.execute("SELECT company_name, analysis, timestamp FROM analyses ORDER BY rowid")
+        for name, analysis, timestamp in cursor:
+            yield name, {"analysis": analysis, "timestamp": timestamp}
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def open_analysis_store(path):
+    """拡張子に応じてストアを開きます（.json は従来形式、それ以外は SQLite）。"""
+    if path.endswith(".json"):
+        return JsonAnalysisStore(path)
+    return SqliteAnalysisStore(path)
+
+def append_analysis_log(records, path=ANALYSIS_LOG_FILE):
+    """分析結果を1行1件の JSONL としてログの末尾に追記します（既存の行は書き直しません）。"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for name, record in records.items():
+            f.write(json.dumps({"company_name": name, **record}, ensure_ascii=False) + "\n")
+
+def replay_analysis_log(store, path=ANALYSIS_LOG_FILE):
+    """
+    ログのうちストアに反映されていない記録（未登録の会社、またはタイムスタンプが異なるもの）を取り込み、
+    取り込んだ件数を返します。壊れた行は読み飛ばします。
+    """
+    if not os.path.exists(path):
+        return 0
+    records = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                name = entry.pop("company_name")
+            except (ValueError, KeyError, AttributeError):
+                print(f"警告: 分析ログの不正な行を読み飛ばします: {line[:80]}")
+                continue
+            records[name] = entry
+    pending = {}
+    for name, record in records.items():
+        current = store.get(name)
+        if current is None or current.get("timestamp") != record.get("timestamp"):
+            pending[name] = record
+    if pending:
+        store.save_many(pending)
+    return len(pending)
+
+def migrate_json_to_store(json_path=ANALYSIS_JSON_FILE, store_path=ANALYSIS_STORE_FILE):
+    """従来の JSON ファイルの内容をストアに取り込みます（既存のキーは上書き）。"""
+    with open(json_path, "r", encoding="utf-8") as f:
+        results = json.load(f)
+    with open_analysis_store(store_path) as store:
+        store.save_many(results)
+    print(f"✅ {len(results)} 件の分析結果を {json_path} から {store_path} に移行しました。")
+    return len(results)
+
+def export_store_to_json(store_path=ANALYSIS_STORE_FILE, json_path=ANALYSIS_JSON_FILE):
+    """ストアの内容を従来の JSON 形式で書き出します。"""
+    with open_analysis_store(store_path) as store:
+        results = dict(store.items())
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"✅ {len(results)} 件の分析結果を {store_path} から {json_path} に書き出しました。")
+    return len(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analysis store migration tool")
+    parser.add_argument("command", choices=["migrate", "replay", "export"],
+                        help="migrate: JSON からストアへ移行、replay: 追記ログの未反映分をストアへ取り込み、"
+                             "export: ストアから JSON へ書き出し")
+    parser.add_argument("--json", default=ANALYSIS_JSON_FILE, help="従来形式の JSON ファイル")
+    parser.add_argument("--store", default=ANALYSIS_STORE_FILE, help="SQLite ストアのファイル")
+    parser.add_argument("--log", default=ANALYSIS_LOG_FILE, help="分析結果の追記ログ（JSONL）")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        if not os.path.exists(args.json):
+            print(f"❌ ファイル {args.json} が見つかりません。")
+            sys.exit(1)
+        migrate_json_to_store(args.json, args.store)
+    elif args.command == "replay":
+        with open_analysis_store(args.store) as store:
+            replayed = replay_analysis_log(store, args.log)
+        print(f"✅ {replayed} 件の分析結果を {args.log} から {args.store} に取り込みました。")
+    else:
+        export_store_to_json(args.store, args.json)
+
+if __name__ == "__main__":
+    main()
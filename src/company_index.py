@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import argparse
+import unicodedata
+from collections import Counter, defaultdict
+
+from src.analysis_store import ANALYSIS_JSON_FILE, open_analysis_store
+
+# 正規化時に取り除く法人格などの表記（NFKC・小文字化した後の文字列に対して適用）
+CORPORATE_SUFFIXES = [
+    "株式会社", "有限会社", "合同会社", "合資会社", "合名会社",
+    "一般社団法人", "公益社団法人", "一般財団法人", "公益財団法人",
+    "独立行政法人", "国立研究開発法人", "社会福祉法人",
+    "(株)", "(有)", "(同)", "㈱", "㈲",
+    "co.,ltd.", "co., ltd.", "co.ltd.", "corporation", "corp.", "inc.", "ltd.", "llc", "k.k.",
+]
+
+# 会社名として扱わない（伏せ字などの）抽出結果（括弧書きを含む元の表記に対して適用）
+JUNK_PATTERNS = [
+    re.compile(r"非公開|架空|xxx|記載なし|情報なし|不明|^複数の"),
+    re.compile(r"^【"),
+]
+# 求人タイトルや職種名らしい抽出結果（括弧書きを除いた表記に対して適用）
+# 「株式会社Finatextホールディングス（ご採用の場合は…）」のような補足を誤って弾かないよう、括弧内は見ない
+TITLE_PATTERNS = [
+    re.compile(r"求人|採用|ポジション"),
+    re.compile(r"(企業|エンジニア|サイエンティスト|アナリスト|スタッフ)$"),
+]
+
+PARENTHETICAL_RE = re.compile(r"[(（\[［【][^)）\]］】]*[)）\]］】]")
+# 「AKKODiS（アコーディス）」のように英字表記の直後に読みが付いている場合の読み部分
+READING_RE = re.compile(r"[a-z0-9&.\-]+[(（]([^)）]+)[)）]")
+IGNORED_CHARS_RE = re.compile(r"[\s・･.,、。'\"&＆\-‐－_/]")
+HEAD_MIN_SIMILARITY = 0.5  # 共通の末尾より前の部分どうしに求める類似度（Dice 係数）
+
+def _strip_symbols(text):
+    """絵文字などの記号類（Unicode カテゴリ S*）と制御文字を取り除きます。"""
+    return "".join(ch for ch in text if not unicodedata.category(ch).startswith(("S", "C")))
+
+def _strip_suffixes(text):
+    for suffix in CORPORATE_SUFFIXES:
+        text = text.replace(suffix, "")
+    return text
+
+def _finalize(text):
+    text = PARENTHETICAL_RE.sub("", text)
+    text = _strip_suffixes(text)
+    return IGNORED_CHARS_RE.sub("", text)
+
+def normalize_company_name(name):
+    """
+    会社名を比較用に正規化します。
+    NFKC 正規化（全角・半角の統一）、小文字化、絵文字の除去、括弧書きの除去、法人格の除去を行います。
+
+    例: "🏢 AKKODiS（アコーディス）コンサルティング株式会社" → "akkodisコンサルティング"
+    """
+    text = unicodedata.normalize("NFKC", name).lower()
+    text = _strip_symbols(text)
+    # 法人格の略記 "(株)" などは括弧ごと消える前に取り除く
+    text = _strip_suffixes(text)
+    return _finalize(text)
+
+def company_name_variants(name):
+    """
+    正規化した会社名と、英字表記の直後に付いた読み（括弧内）で置き換えた別表記を返します。
+
+    例: "AKKODiS（アコーディス）コンサルティング株式会社"
+        → ["akkodisコンサルティング", "アコーディスコンサルティング"]
+    """
+    text = _strip_suffixes(_strip_symbols(unicodedata.normalize("NFKC", name).lower()))
+    variants = [_finalize(text)]
+    reading = _finalize(READING_RE.sub(lambda m: m.group(1), text))
+    if reading and reading not in variants:
+        variants.append(reading)
+    return [v for v in variants if v]
+
+def is_valid_company_name(name):
+    """伏せ字や職種名など、会社名として登録すべきでない抽出結果なら False を返します。"""
+    if not name or not normalize_company_name(name):
+        return False
+    text = unicodedata.normalize("NFKC", name).lower().strip()
+    if any(pattern.search(text) for pattern in JUNK_PATTERNS):
+        return False
+    title = PARENTHETICAL_RE.sub("", text).strip()
+    return not any(pattern.search(title) for pattern in TITLE_PATTERNS)
+
+def _ngrams(text, n=2):
+    if len(text) < n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def _is_affix(a, b):
+    """一方がもう一方の先頭または末尾にそのまま含まれている（「トヨタ自動車」と「トヨタ自動車九州」など）なら True。"""
+    shorter, longer = sorted((a, b), key=len)
+    return longer.startswith(shorter) or longer.endswith(shorter)
+
+def _differs_in_digits(a, b):
+    """共通の先頭・末尾を除いた相違部分に数字が含まれている（「新規00197」と「新規00198」など）なら True。"""
+    head = len(os.path.commonprefix([a, b]))
+    tail = len(os.path.commonprefix([a[head:][::-1], b[head:][::-1]]))
+    return any(ch.isdigit() for ch in a[head:len(a) - tail] + b[head:len(b) - tail])
+
+def _heads_differ(a, b, n=2):
+    """
+    共通の末尾（「グローバルソリューションズ」などの一般的な事業名）より前の、会社を特定する部分が
+    似ていない（「ソニーグローバルソリューションズ」と「necグローバルソリューションズ」など）なら True。
+    """
+    tail = len(os.path.commonprefix([a[::-1], b[::-1]]))
+    if not tail:
+        return False
+    head_a, head_b = _ngrams(a[:len(a) - tail], n), _ngrams(b[:len(b) - tail], n)
+    return 2 * len(head_a & head_b) / (len(head_a) + len(head_b)) < HEAD_MIN_SIMILARITY
+
+def _is_different_company(a, b, n=2):
+    """
+    正規化表記 a・b の n-gram がよく似ていても、別の企業とみなすべき組み合わせなら True を返します。
+    一般的な語句が長いほど Dice 係数は高くなるため、類似度だけでは次のような組み合わせを名寄せしてしまいます。
+    - 一方が他方に地域名などを付け足しただけ: 「トヨタ自動車」と「トヨタ自動車九州」
+    - 番号だけが異なる: 「新規00197」と「新規00198」
+    - 共通の事業名の前の固有部分が異なる: 「ソニーグローバルソリューションズ」と「necグローバルソリューションズ」
+    """
+    return _is_affix(a, b) or _differs_in_digits(a, b) or _heads_differ(a, b, n)
+
+
+class CompanyIndex:
+    """
+    会社名の同一性を判定するインデックス。
+    正規化した表記の完全一致は辞書で、表記ゆれは文字 n-gram の転置インデックスで候補を絞ってから
+    Dice 係数で類似度を計算し、threshold 以上の既存エントリに名寄せします。
+    一方が他方に地域名などを付け足しただけの表記（グループ会社・子会社であることが多い）や、
+    番号・会社を特定する先頭部分だけが異なる表記は、類似度が高くても名寄せしません（_is_different_company）。
+    """
+    def __init__(self, names=(), threshold=0.8, n=2):
+        self.threshold = threshold
+        self.n = n
+        self.exact = {}                     # 正規化表記 → 登録済みの会社名
+        self.grams = {}                     # 正規化表記 → n-gram 集合
+        self.postings = defaultdict(set)    # n-gram → 正規化表記の集合
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(set(self.exact.values()))
+
+    def add(self, name):
+        for variant in company_name_variants(name):
+            if variant in self.exact:
+                continue
+            self.exact[variant] = name
+            grams = _ngrams(variant, self.n)
+            self.grams[variant] = grams
+            for gram in grams:
+                self.postings[gram].add(variant)
+
+    def find(self, name, threshold=None):
+        """
+        name と同一とみなせる登録済みの会社名を返します。見つからなければ None。
+        """
+        if threshold is None:
+            threshold = self.threshold
+        best_name, best_score = None, 0.0
+        for variant in company_name_variants(name):
+            if variant in self.exact:
+                return self.exact[variant]
+            grams = _ngrams(variant, self.n)
+            shared = Counter()
+            for gram in grams:
+                for candidate in self.postings.get(gram, ()):
+                    shared[candidate] += 1
+            for candidate, count in shared.items():
+                if _is_different_company(variant, candidate, self.n):
+                    continue
+                score = 2 * count / (len(grams) + len(self.grams[candidate]))
+                if score > best_score:
+                    best_name, best_score = self.exact[candidate], score
+        return best_name if best_score >= threshold else None
+
+
+def find_duplicate_clusters(names, threshold=0.8):
+    """
+    names のうち同一企業とみなせるものをまとめ、2件以上のクラスタのリストを返します。
+    """
+    parent = {name: name for name in names}
+
+    def root(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    index = CompanyIndex(threshold=threshold)
+    for name in names:
+        match = index.find(name)
+        if match is not None:
+            parent[root(name)] = root(match)
+        index.add(name)
+
+    clusters = defaultdict(list)
+    for name in names:
+        clusters[root(name)].append(name)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Company name duplicate report")
+    parser.add_argument("command", choices=["report"], help="report: 既存の分析結果の重複クラスタを表示")
+    parser.add_argument("--store", default=ANALYSIS_JSON_FILE,
+                        help="分析結果のファイル（.json または SQLite ストア）")
+    parser.add_argument("--threshold", type=float, default=0.8, help="名寄せとみなす類似度の閾値")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        print(f"❌ ファイル {args.store} が見つかりません。")
+        sys.exit(1)
+    with open_analysis_store(args.store) as store:
+        names = list(store.keys())
+
+    clusters = find_duplicate_clusters(names, threshold=args.threshold)
+    print(f"🔎 {len(names)} 件中 {len(clusters)} 個の重複クラスタが見つかりました。")
+    for i, members in enumerate(clusters, start=1):
+        print(f"{i}. " + " / ".join(members))
+
+    junk = [name for name in names if not is_valid_company_name(name)]
+    print(f"\n⚠️ 会社名として不適切なキー: {len(junk)} 件")
+    for name in junk:
+        print(f"- {name}")
+
+if __name__ == "__main__":
+    main()
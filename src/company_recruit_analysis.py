@@ -1,11 +1,22 @@
-import os
-import json
-import requests
-import re
-from bs4 import BeautifulSoup
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from google import genai
+from src.slack_client import SlackClient, STREAMING_NOTICE
+from src.analysis_store import AnalysisStore, open_analysis_store
+from src.company_index import CompanyIndex, is_valid_company_name
+from src.job_feed import JobPosting
+from src.gemini_cache import GeminiResponseCache
+from src.gemini_quota import GeminiQuota, QuotaDeferred
+from src.instrumentation import Tracer
+
+ANALYSIS_MODEL = 'gemini-2.0-flash-exp'
+ANALYSIS_CONFIG = {'tools': [{'google_search': {}}]}
+CAUTION_TEXT = (
+    "※これは本日のウェブサイト情報を Gemini が検索してまとめたものであり、"
+    "内容の正確性を保証するものではありません。興味のある情報はご自身でご確認ください。"
+)
 
 class CompanyRecruitAnalysis:
     """
@@ -13,14 +24,35 @@ class CompanyRecruitAnalysis:
     400文字以内で生成し、Slack に投稿するクラスです。
     同一の会社名での重複分析を防ぐため、抽出した会社名をキーとして結果を保存します。
     """
-    def __init__(self, api_key, slack_bot_token, slack_channel_id):
-        self.client = genai.Client(api_key=api_key, http_options={'api_version': 'v1alpha'})
-        self.chat = self.client.chats.create(
-            model='gemini-2.0-flash-exp',
-            config={'tools': [{'google_search': {}}]}
-        )
+    def __init__(self, api_key, slack_bot_token, slack_channel_id, match_threshold=0.8,
+                 slack_client=None, gemini_cache=None, tracer=None, gemini_client=None, search_index=None,
+                 stream=False, quota=None):
+        # 各ステージの処理時間・トークン数の計測
+        self.tracer = tracer or Tracer("analysis")
+        # ベンチマークなどでは genai.Client の代わりに代替クライアントを渡せる
+        self.client = gemini_client or genai.Client(api_key=api_key, http_options={'api_version': 'v1alpha'})
+        self.reset_chat()
+        # Gemini の応答キャッシュ（再実行時に同じ企業分析を再課金しないため）
+        self.gemini_cache = gemini_cache or GeminiResponseCache(enabled=False)
+        # Gemini の利用枠の台帳（枠が足りない場合、企業分析は次回の実行に持ち越す）
+        self.quota = quota or GeminiQuota(enabled=False)
         self.slack_bot_token = slack_bot_token
         self.slack_channel_id = slack_channel_id
+        # Slack への投稿はクラス間で共有できる SlackClient に任せる
+        self.slack = slack_client or SlackClient(slack_bot_token, slack_channel_id, tracer=self.tracer)
+        # 表記ゆれのある会社名を同一企業とみなす類似度の閾値
+        self.match_threshold = match_threshold
+        # 分析結果を保存するたびに1件ずつ反映する全文検索インデックス（None なら更新しない）
+        self.search_index = search_index
+        # True の場合、run_analysis_for_one で分析を生成しながら Slack に段階的に投稿する
+        self.stream = stream
+
+    def reset_chat(self):
+        """会話履歴を持たない新しいチャットセッションを作ります（常駐時に履歴が伸び続けないようにするため）。"""
+        self.chat = self.client.chats.create(
+            model=ANALYSIS_MODEL,
+            config=ANALYSIS_CONFIG
+        )
 
     def extract_company_name(self, job_text):
         """
@@ -57,8 +89,8 @@ class CompanyRecruitAnalysis:
         print(f"✅ 抽出した企業名: {company}")
         return company
 
-    def analyze_company(self, full_text):
-        prompt = f"""
+    def build_analysis_prompt(self, full_text):
+        return f"""
     以下は、障がい者向けのデータサイエンス系求人の一件分の要約です：
     
     --- 求人情報 ---
@@ -84,82 +116,228 @@ class CompanyRecruitAnalysis:
     結果は400文字以内で、箇条書きまたは明快な段落でまとめてください。
     なお、回答はマークダウン形式（** やその他の記法）ではなく、プレーンテキスト形式で返してください。
     """
-        result = self.chat.send_message(prompt)
+
+    def analyze_company(self, full_text, stateless=False):
+        """
+        企業分析を生成します。
+        stateless=True の場合は self.chat の履歴を使わず、1社ごとに独立した generate_content を発行します
+        （バッチ実行時に履歴が伸びてトークン消費が増えるのを防ぐため）。
+        """
+        prompt = self.build_analysis_prompt(full_text)
+        with self.tracer.stage("gemini.analysis", model=ANALYSIS_MODEL, stateless=stateless) as event:
+            if stateless:
+                result = self.gemini_cache.get_or_generate(
+                    self.quota.wrap("analysis", lambda: self.client.models.generate_content(
+                        model=ANALYSIS_MODEL,
+                        contents=prompt,
+                        config=ANALYSIS_CONFIG
+                    ), prompt, event=event),
+                    ANALYSIS_MODEL, prompt, ANALYSIS_CONFIG, event=event
+                )
+            else:
+                result = self.gemini_cache.send_message(
+                    self.chat, ANALYSIS_MODEL, prompt, ANALYSIS_CONFIG, event=event,
+                    send=self.quota.wrap("analysis", self.chat.send_message, prompt, event=event)
+                )
+            self.tracer.record_gemini_response(event, result)
         response_text = "".join(part.text for part in result.candidates[0].content.parts if part.text)
         print("✅ 分析結果:")
         print(response_text)
         return response_text
 
+    def stream_analysis(self, full_text):
+        """
+        analyze_company のストリーミング版。生成された分析テキストの断片を順に返します。
+        会話履歴を使わない generate_content_stream で生成し、キャッシュがあれば全文を一度に返します。
+        """
+        prompt = self.build_analysis_prompt(full_text)
+        with self.tracer.stage("gemini.analysis", model=ANALYSIS_MODEL, stateless=True, stream=True) as event:
+            start = time.perf_counter()
+            pieces = self.gemini_cache.stream_or_replay(
+                self.quota.wrap("analysis", lambda: self.client.models.generate_content_stream(
+                    model=ANALYSIS_MODEL,
+                    contents=prompt,
+                    config=ANALYSIS_CONFIG
+                ), prompt, stream=True, event=event),
+                ANALYSIS_MODEL, prompt, ANALYSIS_CONFIG, event=event,
+                on_complete=lambda response: self.tracer.record_gemini_response(event, response)
+            )
+            for piece in pieces:
+                event.setdefault("first_chunk_ms", round((time.perf_counter() - start) * 1000, 1))
+                yield piece
+
+    @staticmethod
+    def render_partial_analysis(text):
+        """生成途中の分析のうち、書き終わった行までに生成中の表示を付けて返します（1行も完成していなければ None）。"""
+        cut = text.rfind("\n")
+        if cut < 0 or not text[:cut].strip():
+            return None
+        return f"{text[:cut].strip()}\n\n{STREAMING_NOTICE}"
+
     def post_message_to_slack(self, message):
-        headers = {
-            "Authorization": f"Bearer {self.slack_bot_token}",
-            "Content-Type": "application/json"
-        }
-        today_date = datetime.now().strftime("%Y-%m-%d")
-        for channel in self.slack_channel_id:
-            payload = {
-                "channel": channel,
-                "text": message,
-                "unfurl_links": False,
-                "unfurl_media": False,
-            }
-            response = requests.post("https://slack.com/api/chat.postMessage", headers=headers, json=payload)
-            data = response.json()
-            if data.get("ok"):
-                print(f"✅ {today_date} に Slack へ分析結果を投稿しました！(チャンネル: {channel})")
-            else:
-                print(f"❌ 投稿に失敗しました: {data.get('error')} (チャンネル: {channel})")
-                print("詳細:", data)
+        """全チャンネルへ投稿し、チャンネルごとの DeliveryResult のリストを返します。"""
+        return self.slack.post_message(message, label="分析結果")
 
-    def run_analysis_for_one(self, req_text, analysis_file):
+    def open_store(self, analysis_store):
+        """ファイルパスが渡された場合は拡張子に応じたストアを開きます。"""
+        if isinstance(analysis_store, AnalysisStore):
+            return analysis_store
+        return open_analysis_store(analysis_store)
+
+    def iter_jobs(self, req_text):
         """
-        req_text（求人情報全体）を分割し、各求人について抽出した会社名が
-        既に analysis_file に保存されている場合は除外し、未分析の求人のうち先頭1件のみを対象として企業分析を実施します。
-        分析結果は Slack に投稿するとともに、analysis_file に会社名をキーとして保存します。
+        (会社名, 求人テキスト) を順に返します。
+        req_text が文字列の場合は空行で分割して会社名を抽出し、
+        JobPosting のイテレータ（求人フィード）の場合はレコードの会社名をそのまま使います。
         """
-        # 求人情報を空行2行で分割（簡易な実装例）
-        jobs = [job.strip() for job in req_text.strip().split("\n\n") if job.strip()]
-        if not jobs:
-            print("❌ 求人情報が空です。")
+        if isinstance(req_text, str):
+            # 求人情報を空行2行で分割（簡易な実装例）
+            for job in req_text.strip().split("\n\n"):
+                if job.strip():
+                    yield self.extract_company_name(job.strip()), job.strip()
             return
-    
-        # 既存の分析結果を JSON ファイルから読み込む（キーはすでに会社名が登録されている）
-        analysis_results = {}
-        if os.path.exists(analysis_file):
-            with open(analysis_file, "r", encoding="utf-8") as f:
-                analysis_results = json.load(f)
-    
-        unprocessed_job = None
-        for job in jobs:
-            company_name = self.extract_company_name(job)
+        for posting in req_text:
+            if isinstance(posting, JobPosting):
+                yield posting.company, posting.to_text()
+
+    def save_records(self, store, records):
+        """分析結果をストアに保存し、全文検索インデックスにも追加します。"""
+        store.save_many(records)
+        if self.search_index is not None:
+            for company_name, record in records.items():
+                self.search_index.add(company_name, record["analysis"])
+
+    def find_unprocessed_jobs(self, req_text, store, limit=None, quiet=False):
+        """
+        req_text（求人情報全体、または JobPosting のイテレータ）から、store に未登録の会社の求人を
+        (会社名, 求人テキスト) のリストとして先頭から最大 limit 件返します。
+        表記ゆれ（法人格・括弧書き・全角半角の違いなど）は CompanyIndex で既存の会社に名寄せし、
+        同じ会社が複数回出てくる場合は最初の求人のみを対象とします。
+        quiet=True の場合はスキップした求人のログを出しません。
+        """
+        log = (lambda message: None) if quiet else print
+        index = None
+        unprocessed = []
+        for company_name, job in self.iter_jobs(req_text):
             if not company_name:
-                print("警告: 会社名が抽出できませんでした。求人をスキップします。")
+                log("警告: 会社名が抽出できませんでした。求人をスキップします。")
                 continue
-            if company_name in analysis_results:
-                print(f"既に分析済みの会社 {company_name} をスキップします。")
+            if not is_valid_company_name(company_name):
+                log(f"警告: 「{company_name}」は会社名として扱えないためスキップします。")
                 continue
-            # 未分析の求人が見つかったらその求人を対象とする
-            unprocessed_job = (company_name, job)
-            break
-    
-        if not unprocessed_job:
+            if company_name in store:
+                log(f"既に分析済みの会社 {company_name} をスキップします。")
+                continue
+            if index is None:
+                # 完全一致しなかった場合のみ、既存の会社名からインデックスを構築する
+                index = CompanyIndex(store.keys(), threshold=self.match_threshold)
+            alias_of = index.find(company_name)
+            if alias_of is not None:
+                log(f"既に分析済みの会社 {alias_of} と同一とみなし、{company_name} をスキップします。")
+                continue
+            index.add(company_name)
+            unprocessed.append((company_name, job))
+            if limit is not None and len(unprocessed) >= limit:
+                break
+        return unprocessed
+
+    def run_analysis_for_one(self, req_text, analysis_store):
+        """
+        req_text（求人情報全体）を分割し、各求人について抽出した会社名が
+        既に analysis_store に保存されている場合は除外し、未分析の求人のうち先頭1件のみを対象として企業分析を実施します。
+        分析結果は Slack に投稿するとともに、analysis_store に会社名をキーとして保存します。
+        req_text には求人情報テキストのほか、求人フィードの JobPosting イテレータも指定できます。
+        analysis_store には AnalysisStore またはファイルパス（.json / .db）を指定できます。
+        """
+        if isinstance(req_text, str) and not req_text.strip():
+            print("❌ 求人情報が空です。")
+            return
+
+        store = self.open_store(analysis_store)
+        unprocessed_jobs = self.find_unprocessed_jobs(req_text, store, limit=1)
+        if not unprocessed_jobs:
             print("すべての求人情報は既に分析済みです。")
             return
-    
-        company_name, job_text = unprocessed_job
-        analysis_result = self.analyze_company(job_text)
-        caution_text = (
-            "※これは本日のウェブサイト情報を Gemini が検索してまとめたものであり、"
-            "内容の正確性を保証するものではありません。興味のある情報はご自身でご確認ください。"
-        )
-        final_message = f"{analysis_result}\n\n{caution_text}"
-        self.post_message_to_slack(final_message)
-    
+
+        company_name, job_text = unprocessed_jobs[0]
+        try:
+            if self.stream:
+                # 書き終わった行から順に Slack のメッセージを更新し、最後に注意書きを付けた最終版にする
+                analysis_result, _ = self.slack.post_stream(
+                    self.stream_analysis(job_text),
+                    self.render_partial_analysis,
+                    lambda text: f"{text.strip()}\n\n{CAUTION_TEXT}",
+                    label="分析結果"
+                )
+                analysis_result = analysis_result.strip()
+                print("✅ 分析結果:")
+                print(analysis_result)
+            else:
+                analysis_result = self.analyze_company(job_text)
+                final_message = f"{analysis_result}\n\n{CAUTION_TEXT}"
+                self.post_message_to_slack(final_message)
+        except QuotaDeferred as e:
+            # 未分析のまま残し、次回の実行で改めて分析する
+            print(f"⏸️ {company_name} の分析を次回に持ち越します: {e}")
+            return
+
         # 分析結果を会社名をキーとして保存（ハッシュではなく、抽出された公式な会社名をそのまま使用）
-        analysis_results[company_name] = {
+        self.save_records(store, {company_name: {
             "analysis": analysis_result,
             "timestamp": datetime.now(ZoneInfo("Asia/Tokyo")).isoformat()
-        }
-        with open(analysis_file, "w", encoding="utf-8") as f:
-            json.dump(analysis_results, f, indent=2, ensure_ascii=False)
+        }})
         print("分析結果を保存しました。")
+
+    def run_analysis_batch(self, req_text, analysis_store, max_companies=5, concurrency=3):
+        """
+        未分析の会社を一度に収集し、最大 max_companies 社を concurrency 並列で企業分析します。
+        各社の分析は履歴を持たない独立したリクエストとして実行し、
+        Slack へは求人の並び順で投稿、analysis_store への保存は最後に1回だけ行います。
+        """
+        if isinstance(req_text, str) and not req_text.strip():
+            print("❌ 求人情報が空です。")
+            return
+
+        store = self.open_store(analysis_store)
+        unprocessed_jobs = self.find_unprocessed_jobs(req_text, store, limit=max_companies)
+        if not unprocessed_jobs:
+            print("すべての求人情報は既に分析済みです。")
+            return
+        print(f"🔎 {len(unprocessed_jobs)} 社を最大 {concurrency} 並列で分析します。")
+
+        results = {}
+        deferred = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {
+                executor.submit(self.analyze_company, job_text, True): company_name
+                for company_name, job_text in unprocessed_jobs
+            }
+            for future in as_completed(futures):
+                company_name = futures[future]
+                try:
+                    results[company_name] = future.result()
+                except QuotaDeferred as e:
+                    deferred.append(company_name)
+                    print(f"⏸️ {company_name} の分析を次回に持ち越します: {e}")
+                except Exception as e:
+                    print(f"❌ {company_name} の分析に失敗しました: {e}")
+
+        if not results:
+            if deferred and len(deferred) == len(unprocessed_jobs):
+                print("⏸️ Gemini の利用枠が足りないため、すべての分析を次回に持ち越しました。")
+            else:
+                print("❌ 分析に成功した会社がありませんでした。")
+            return
+
+        new_records = {}
+        for company_name, _ in unprocessed_jobs:
+            if company_name not in results:
+                continue
+            analysis_result = results[company_name]
+            self.post_message_to_slack(f"{analysis_result}\n\n{CAUTION_TEXT}")
+            new_records[company_name] = {
+                "analysis": analysis_result,
+                "timestamp": datetime.now(ZoneInfo("Asia/Tokyo")).isoformat()
+            }
+        self.save_records(store, new_records)
+        print(f"✅ {len(results)}/{len(unprocessed_jobs)} 社の分析結果を保存しました。")
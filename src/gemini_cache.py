@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from google.genai import types
+
+GEMINI_CACHE_DIR = "data/gemini_cache"  # Gemini の応答キャッシュ（1応答1ファイル）
+
+class GeminiResponseCache:
+    """
+    Gemini の応答を「モデル名・プロンプト・ツール設定」のハッシュをキーにしてディスクに保存するキャッシュ。
+    ワークフローの再実行時に同じリクエストを再び課金せず、保存済みの応答（grounding_metadata を含む）を再生します。
+    - ttl: エントリの有効期限（秒）。get_or_generate 呼び出しごとに上書きできます
+    - max_entries: 保存する応答の上限。超えた分は古いものから削除します
+    - enabled: False の場合はキャッシュを読まずに常に API を呼び出します（書き込みも行いません）
+    """
+    def __init__(self, cache_dir=GEMINI_CACHE_DIR, ttl=24 * 60 * 60, max_entries=500, enabled=True):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, contents, config=None, history=None):
+        """リクエスト内容から SHA-256 のキーを作ります。"""
+        payload = {
+            "model": model,
+            "contents": contents,
+            "config": config or {},
+            "history": history or [],
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return types.GenerateContentResponse.model_validate(entry["response"])
+
+    def put(self, key, response, ttl=None):
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "expires_at": time.time() + (self.ttl if ttl is None else ttl),
+            "response": response.model_dump(mode="json", exclude_none=True),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """max_entries を超えた分を更新日時の古い順に削除します。"""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".json")]
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+        paths = sorted((os.path.join(self.cache_dir, n) for n in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_generate(self, generate, model, contents, config=None, history=None, ttl=None, event=None):
+        """
+        キャッシュに有効な応答があればそれを返し、なければ generate() を呼び出して結果を保存します。
+        event（計測用のイベント辞書）を渡すと、キャッシュから再生したかどうかを "cached" に記録します。
+        """
+        key = self.make_key(model, contents, config, history)
+        cached = self.get(key)
+        if event is not None:
+            event["cached"] = cached is not None
+        if cached is not None:
+            self.hits += 1
+            print(f"♻️ Gemini の応答をキャッシュから再利用しました（{key[:12]}）。")
+            return cached
+        self.misses += 1
+        response = generate()
+        self.put(key, response, ttl)
+        return response
+
+    def stream_or_replay(self, generate_stream, model, contents, config=None, history=None, ttl=None,
+                         event=None, on_complete=None):
+        """
+        ストリーミング生成のキャッシュ付き版。テキストの断片を順に返すジェネレータです。
+        キャッシュに有効な応答があれば全文を一度に返し、なければ generate_stream() の各チャンクのテキストを
+        そのまま返しながら、最後に結合した応答（最終チャンクの usage_metadata・grounding_metadata を含む）を保存します。
+        on_complete を渡すと、全文が揃った時点で結合後の応答を引数に呼び出します（トークン数の記録などに使用）。
+        """
+        key = self.make_key(model, contents, config, history)
+        cached = self.get(key)
+        if event is not None:
+            event["cached"] = cached is not None
+        if cached is not None:
+            self.hits += 1
+            print(f"♻️ Gemini の応答をキャッシュから再利用しました（{key[:12]}）。")
+            if on_complete is not None:
+                on_complete(cached)
+            yield cached.text or ""
+            return
+        self.misses += 1
+        texts = []
+        last_chunk = None
+        grounding_metadata = None
+        for chunk in generate_stream():
+            last_chunk = chunk
+            if chunk.candidates and chunk.candidates[0].grounding_metadata:
+                grounding_metadata = chunk.candidates[0].grounding_metadata
+            if chunk.text:
+                texts.append(chunk.text)
+                yield chunk.text
+        response = types.GenerateContentResponse(
+            candidates=[types.Candidate(
+                content=types.Content(role="model", parts=[types.Part(text="".join(texts))]),
+                grounding_metadata=grounding_metadata,
+            )],
+            usage_metadata=last_chunk.usage_metadata if last_chunk else None,
+        )
+        if on_complete is not None:
+            on_complete(response)
+        self.put(key, response, ttl)
+
+    def send_message(self, chat, model, message, config=None, ttl=None, event=None, send=None):
+        """
+        chat.send_message のキャッシュ付き版。会話履歴もキーに含め、
+        キャッシュから再生した場合も同じやり取りを chat の履歴に記録します。
+        send を渡すと、キャッシュにない場合に chat.send_message の代わりに send(message) を呼び出します。
+        """
+        history = [c.model_dump(mode="json", exclude_none=True) for c in chat.get_history()]
+        key = self.make_key(model, message, config, history)
+        cached = self.get(key)
+        if event is not None:
+            event["cached"] = cached is not None
+        if cached is None:
+            self.misses += 1
+            response = (send or chat.send_message)(message)
+            self.put(key, response, ttl)
+            return response
+        self.hits += 1
+        print(f"♻️ Gemini の応答をキャッシュから再利用しました（{key[:12]}）。")
+        candidate = cached.candidates[0] if cached.candidates else None
+        chat.record_history(
+            user_input=types.UserContent(parts=[types.Part(text=message)]),
+            model_output=[candidate.content] if candidate and candidate.content else [],
+            is_valid=True,
+        )
+        return cached
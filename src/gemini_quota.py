@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+GEMINI_QUOTA_FILE = "data/gemini_quota.json"   # プロセス間で共有する Gemini の利用枠の台帳
+GEMINI_QUOTA_LOCK_FILE = "data/.gemini_quota.lock"
+PRIORITIES = ("summary", "analysis")          # 先頭ほど優先度が高い
+DEFAULT_RESPONSE_TOKENS = 2048                # 応答トークン数の見積もり（実際の値は応答後に補正する）
+THROTTLE_CODES = {429, 503}
+LIMIT_LABELS = {"requests": "リクエスト数", "tokens": "トークン数"}
+
+class QuotaDeferred(Exception):
+    """利用枠が足りないため、リクエストを次回の実行に持ち越すことを表す例外。"""
+
+
+def estimate_tokens(contents, response_tokens=DEFAULT_RESPONSE_TOKENS):
+    """プロンプトの文字数から使用トークン数を大まかに見積もります（日本語は概ね2文字で1トークン未満）。"""
+    return len(str(contents)) // 2 + response_tokens
+
+def total_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return (usage.total_token_count or 0) if usage is not None else None
+
+def throttle_delay(error):
+    """
+    429 / 503 のエラーなら Retry-After（秒、なければ 0）を返し、それ以外のエラーなら None を返します。
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code not in THROTTLE_CODES:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class GeminiQuota:
+    """
+    Gemini の利用枠（1分あたり・1日あたりのリクエスト数とトークン数）をディスク上の台帳で管理し、
+    summary と analysis のプロセスが同時に動いても合計が上限を超えないようにします。
+    - 1分あたりの上限はトークンバケットで管理し、足りなければ補充されるまで待ちます
+    - analysis は各上限の reserve の割合を summary のために残し、summary が待っている間は新しいリクエストを出しません
+    - 429 / 503 を受けると全プロセス共通の待ち時間を指数的に延ばし、成功すると元に戻します
+    - 待ち時間が max_wait を超える場合や1日の上限に達した場合は QuotaDeferred を送出します
+    - enabled: False の場合は台帳を使わずにそのまま呼び出します
+    - event（Tracer.stage のイベント辞書）を渡すと、スロットリングによる再試行回数を retries に、
+      枠の空きを待った時間を quota_wait_ms に加算します
+    """
+    def __init__(self, path=GEMINI_QUOTA_FILE, lock_file=GEMINI_QUOTA_LOCK_FILE,
+                 rpm=10, tpm=1_000_000, rpd=1500, tpd=None, reserve=0.2,
+                 max_wait=None, max_retries=4, backoff_base=2.0, backoff_max=120.0, enabled=True):
+        self.path = path
+        self.lock_file = lock_file
+        self.limits = {"requests": rpm, "tokens": tpm}
+        self.daily_limits = {"requests": rpd, "tokens": tpd}
+        self.reserve = reserve
+        self.max_wait = {"summary": 600, "analysis": 60, **(max_wait or {})}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _ledger(self):
+        """台帳を排他ロックした上で読み込み、ブロックを抜けるときに書き戻します。"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.lock_file, "w") as lock_fd:
+            try:
+                import fcntl
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            except ImportError:
+                # fcntl のない環境（Windows）ではプロセス内の排他のみ行う
+                pass
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+            yield state
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".gemini_quota.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _refill(self, state, now):
+        """日付が変わっていれば1日の集計をリセットし、1分あたりのバケットを経過時間分だけ補充します。"""
+        today = datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d")
+        if state.get("day") != today:
+            state["day"] = today
+            state["day_used"] = {"requests": 0, "tokens": 0}
+        buckets = state.setdefault("buckets", {})
+        for name, capacity in self.limits.items():
+            if not capacity:
+                continue
+            bucket = buckets.setdefault(name, {"level": capacity, "updated_at": now})
+            elapsed = max(0.0, now - bucket["updated_at"])
+            bucket["level"] = min(capacity, bucket["level"] + elapsed * capacity / 60)
+            bucket["updated_at"] = now
+
+    def _admit(self, state, priority, estimated_tokens, now):
+        """
+        枠があれば消費して 0 を返し、なければ待つべき秒数を返します。
+        1日の上限に達している場合は QuotaDeferred を送出します。
+        """
+        self._refill(state, now)
+        floor_ratio = self.reserve if priority != "summary" else 0.0
+        need = {"requests": 1, "tokens": estimated_tokens}
+
+        for name, limit in self.daily_limits.items():
+            if limit and state["day_used"][name] + need[name] > limit * (1 - floor_ratio):
+                raise QuotaDeferred(f"本日の Gemini の{LIMIT_LABELS[name]}の上限（{limit}）に達しました。")
+
+        wait = max(0.0, state.get("backoff_until", 0) - now)
+        if priority != "summary":
+            # summary が枠を待っている間は、analysis は新しいリクエストを出さない
+            wait = max(wait, state.get("summary_waiting_until", 0) - now)
+        for name, capacity in self.limits.items():
+            if not capacity:
+                continue
+            level = state["buckets"][name]["level"]
+            required = min(need[name], capacity) + capacity * floor_ratio
+            if level < required:
+                wait = max(wait, (required - level) * 60 / capacity)
+        if wait > 0:
+            return wait
+
+        for name, capacity in self.limits.items():
+            if capacity:
+                state["buckets"][name]["level"] -= min(need[name], capacity)
+        state["day_used"]["requests"] += 1
+        state["day_used"]["tokens"] += estimated_tokens
+        return 0
+
+    def acquire(self, priority, estimated_tokens, event=None):
+        """priority（"summary" / "analysis"）のリクエスト1件分の枠を確保するまで待ちます。"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"不明な優先度です: {priority}")
+        deadline = time.monotonic() + self.max_wait[priority]
+        while True:
+            with self._ledger() as state:
+                now = time.time()
+                wait = self._admit(state, priority, estimated_tokens, now)
+                if priority == "summary":
+                    state["summary_waiting_until"] = now + wait + 1 if wait else 0
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise QuotaDeferred(f"Gemini の利用枠の空きを {self.max_wait[priority]} 秒以内に確保できませんでした。")
+            print(f"⏳ Gemini の利用枠の空きを待っています（{priority}、{wait:.1f} 秒）。")
+            time.sleep(wait)
+            if event is not None:
+                event["quota_wait_ms"] = round(event.get("quota_wait_ms", 0) + wait * 1000, 1)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """応答の実際のトークン数で見積もりとの差を補正し、連続スロットリングの回数をリセットします。"""
+        with self._ledger() as state:
+            self._refill(state, time.time())
+            if actual_tokens is not None:
+                diff = actual_tokens - estimated_tokens
+                if self.limits["tokens"]:
+                    state["buckets"]["tokens"]["level"] -= diff
+                state["day_used"]["tokens"] = max(0, state["day_used"]["tokens"] + diff)
+            state["throttles"] = 0
+
+    def record_throttle(self, retry_after=0):
+        """429 / 503 を受けたことを記録し、全プロセス共通の待ち時間（指数バックオフ＋ジッター）を設定します。"""
+        with self._ledger() as state:
+            state["throttles"] = state.get("throttles", 0) + 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (state["throttles"] - 1)))
+            delay = max(retry_after or 0, delay * random.uniform(0.5, 1.0))
+            state["backoff_until"] = max(state.get("backoff_until", 0), time.time() + delay)
+        print(f"⚠️ Gemini からスロットリング応答を受けました。{delay:.1f} 秒後に再試行します。")
+        return delay
+
+    def _give_up(self, priority, error):
+        """再試行し尽くしたスロットリングは、analysis なら持ち越し、summary ならそのまま送出します。"""
+        if priority != "summary":
+            raise QuotaDeferred(f"Gemini のスロットリングが続いています: {error}") from error
+        raise error
+
+    def call(self, priority, generate, estimated_tokens, event=None):
+        """枠を確保してから generate() を呼び出し、429 / 503 の場合は待ち時間を延ばして再試行します。"""
+        if not self.enabled:
+            return generate()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, estimated_tokens, event)
+            try:
+                response = generate()
+            except Exception as e:
+                retry_after = throttle_delay(e)
+                if retry_after is None:
+                    raise
+                if attempt == self.max_retries:
+                    self._give_up(priority, e)
+                self.record_throttle(retry_after)
+                if event is not None:
+                    event["retries"] = event.get("retries", 0) + 1
+                continue
+            self.record_usage(estimated_tokens, total_tokens(response))
+            return response
+
+    def call_stream(self, priority, generate_stream, estimated_tokens, event=None):
+        """
+        call のストリーミング版。チャンクを順に返すジェネレータです。
+        最初のチャンクを受け取る前の 429 / 503 のみ再試行し、途中で失敗した場合はそのまま送出します。
+        """
+        if not self.enabled:
+            yield from generate_stream()
+            return
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, estimated_tokens, event)
+            last_chunk = None
+            try:
+                for chunk in generate_stream():
+                    last_chunk = chunk
+                    yield chunk
+            except Exception as e:
+                retry_after = throttle_delay(e)
+                if retry_after is None or last_chunk is not None:
+                    raise
+                if attempt == self.max_retries:
+                    self._give_up(priority, e)
+                self.record_throttle(retry_after)
+                if event is not None:
+                    event["retries"] = event.get("retries", 0) + 1
+                continue
+            self.record_usage(estimated_tokens, total_tokens(last_chunk))
+            return
+
+    def wrap(self, priority, func, contents, stream=False, event=None):
+        """
+        func(*args, **kwargs) を利用枠の管理下で呼び出す関数を返します。
+        GeminiResponseCache にはこの関数を渡し、キャッシュに応答がない場合だけ枠を消費させます。
+        event には呼び出し元のステージのイベント辞書を渡します。
+        """
+        estimated = estimate_tokens(contents)
+        if stream:
+            return lambda *args, **kwargs: self.call_stream(priority, lambda: func(*args, **kwargs), estimated, event)
+        return lambda *args, **kwargs: self.call(priority, lambda: func(*args, **kwargs), estimated, event)
+
+    def status(self):
+        """台帳の内容を読み取り専用で返します（バケット残量は最後に更新された時点の値）。"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini quota ledger")
+    parser.add_argument("command", choices=["status", "reset"],
+                        help="status: 本日の使用量とバケット残量を表示、reset: 台帳を削除")
+    parser.add_argument("--ledger", default=GEMINI_QUOTA_FILE, help="台帳のファイル")
+    args = parser.parse_args()
+
+    if args.command == "reset":
+        if os.path.exists(args.ledger):
+            os.remove(args.ledger)
+        print(f"✅ {args.ledger} を削除しました。")
+        return
+    state = GeminiQuota(args.ledger).status()
+    if not state:
+        print(f"台帳 {args.ledger} はまだありません。")
+        return
+    used = state["day_used"]
+    print(f"📊 {state['day']} の使用量: {used['requests']} リクエスト / {used['tokens']} トークン")
+    for name, bucket in state.get("buckets", {}).items():
+        age = time.time() - bucket["updated_at"]
+        print(f"    1分あたりの{LIMIT_LABELS[name]}の残り: {bucket['level']:.1f}（{age:.0f} 秒前の時点）")
+    backoff = state.get("backoff_until", 0) - time.time()
+    if backoff > 0:
+        print(f"⚠️ スロットリングのため、あと {backoff:.1f} 秒は新しいリクエストを出しません。")
+
+if __name__ == "__main__":
+    main()
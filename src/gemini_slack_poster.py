@@ -1,45 +1,167 @@
 import os
+import re
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from google import genai
+from src.slack_client import SlackClient, STREAMING_NOTICE, STREAM_ERROR_NOTICE
+from src.reference_cache import ReferenceCache, REFERENCE_CACHE_FILE
+from src.gemini_cache import GeminiResponseCache
+from src.gemini_quota import GeminiQuota
+from src.instrumentation import Tracer
+from src.title_extractor import TITLE_MAX_BYTES, read_title
+from src.job_feed import JOB_FEED_FILE, parse_summary_postings, append_postings, dedupe_postings
 
 MESSAGE_FILE = "data/reqruit.txt"  # 求人情報要約結果を書き出すファイル
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+SEARCH_CONFIG = {'tools': [{'google_search': {}}]}
+CAUTION_TEXT = "※これは本日のウェブサイト情報を Gemini が検索してまとめたものであり、内容の正確性を保証するものではありません。"
+POSTING_HEADER_RE = re.compile(r"^\s*\d+\.\s*🏢", re.MULTILINE)
+MAX_SUMMARY_POSTINGS = 10  # 複数クエリの検索結果をまとめて要約する際の最大件数
+# 複数クエリで検索する場合に、結果を統合・重複除去できるよう求人ごとの出力形式を指定する
+STRUCTURED_SEARCH_FORMAT = (
+    "各求人は次の形式で、1件ごとに空行を挟んで出力してください。\n"
+    "1. 🏢 企業の正式名称\n"
+    "    📍 勤務地: ...\n"
+    "    💼 職種: ...\n"
+    "    💰 給与: ...\n"
+    "    ⏰ 勤務形態: ...\n"
+    "    🔍 特徴: ..."
+)
 
 class GeminiSlackPoster:
     """
     Gemini API を利用して求人情報の要約を生成し、その結果を Slack に投稿するクラス。
     """
-    def __init__(self, gemini_api, slack_bot_token, slack_channel_id):
+    def __init__(self, gemini_api, slack_bot_token, slack_channel_id,
+                 reference_deadline=60, reference_workers=8,
+                 reference_cache_file=REFERENCE_CACHE_FILE, slack_client=None, gemini_cache=None,
+                 tracer=None, gemini_client=None, stream=False, search_concurrency=3, quota=None):
         self.gemini_api = gemini_api
+        # 複数のクエリを渡された場合に同時に実行する検索数
+        self.search_concurrency = search_concurrency
+        # True の場合、要約を生成しながら Slack に段階的に投稿する
+        self.stream = stream
         self.slack_bot_token = slack_bot_token
         self.slack_channel_id = slack_channel_id
+        # 各ステージの処理時間・トークン数の計測
+        self.tracer = tracer or Tracer("summary")
+        # Slack への投稿はクラス間で共有できる SlackClient に任せる
+        self.slack = slack_client or SlackClient(slack_bot_token, slack_channel_id, tracer=self.tracer)
+        # 参照サイト解決の全体の締め切り（秒）と同時実行数
+        self.reference_deadline = reference_deadline
+        self.reference_workers = reference_workers
 
-        # Gemini クライアントの初期化（API バージョン: v1alpha）
-        self.client = genai.Client(api_key=self.gemini_api, http_options={'api_version': 'v1alpha'})
+        # 参照サイトの取得で使い回す keep-alive セッション（スレッド間で共有するためプールを広げる）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=reference_workers, pool_maxsize=reference_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # 参照サイトの解決結果の永続キャッシュ（None を指定すると無効）
+        self.reference_cache = ReferenceCache(reference_cache_file) if reference_cache_file else None
+
+        # Gemini の応答キャッシュ（再実行時に同じリクエストを再課金しないため）
+        self.gemini_cache = gemini_cache or GeminiResponseCache(enabled=False)
+        # Gemini の利用枠の台帳（要約は企業分析より優先される）
+        self.quota = quota or GeminiQuota(enabled=False)
+
+        # Gemini クライアントの初期化（API バージョン: v1alpha）。ベンチマークなどでは代替クライアントを渡せる
+        self.client = gemini_client or genai.Client(api_key=self.gemini_api, http_options={'api_version': 'v1alpha'})
+        self.reset_chat()
+
+    def reset_chat(self):
+        """会話履歴を持たない新しい検索用チャットセッションを作ります（常駐時に履歴が伸び続けないようにするため）。"""
         self.search_client = self.client.chats.create(
-            model='gemini-2.0-flash-exp',
-            config={'tools': [{'google_search': {}}]}
+            model=GEMINI_MODEL,
+            config=SEARCH_CONFIG
         )
 
-    def robust_get(self, url, max_retries=3, timeout=20):
-        for attempt in range(max_retries):
-            try:
-                r = requests.get(url, allow_redirects=True, timeout=timeout)
-                return r
-            except Exception:
-                if attempt < max_retries - 1:
-                    continue
-                else:
-                    return None
-
-    def get_final_url(self, redirect_url):
-        r = self.robust_get(redirect_url)
-        return r.url if r else None
-
-    def summary_client(self, original_text):
-        summary_prompt = f"""
-        以下の文章をもとに、求人情報の各案件を分かりやすく整理し、次のフォーマットで必ず5件にまとめて出力してください。
+    def fetch_title(self, url, max_retries=3, timeout=20, max_bytes=TITLE_MAX_BYTES, deadline_at=None):
+        """
+        url を stream=True で取得し、(最終 URL, ステータスコード, PageTitle) を返します。
+        本文は <title> が読めた時点（最大 max_bytes）で打ち切り、HTML 以外は本文を読みません。
+        deadline_at（time.monotonic() の値）を渡すと、各試行のタイムアウトを締め切りまでの残り時間に縮め、
+        締め切りを過ぎたら再試行せず本文の読み込みも打ち切ります。
+        すべての試行に失敗した場合は None を返します。
+        """
+        with self.tracer.stage("http.fetch", url=url, stream=True) as event:
+            for attempt in range(max_retries):
+                event["retries"] = attempt
+                request_timeout = timeout
+                if deadline_at is not None:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        event["ok"] = False
+                        event["deadline_exceeded"] = True
+                        return None
+                    request_timeout = min(timeout, remaining)
+                try:
+                    with self.session.get(url, allow_redirects=True, timeout=request_timeout, stream=True) as r:
+                        event["status"] = r.status_code
+                        page = (read_title(r, max_bytes=max_bytes, deadline=deadline_at)
+                                if r.status_code == 200 else None)
+                        event["bytes"] = page.bytes_read if page else 0
+                        if page is not None and page.truncated:
+                            event["deadline_exceeded"] = True
+                        return r.url, r.status_code, page
+                except Exception:
+                    if attempt < max_retries - 1:
+                        continue
+                    else:
+                        event["ok"] = False
+                        return None
+
+    def resolve_reference(self, redirect_url, deadline_at=None):
+        """
+        グラウンディングのリダイレクト URL を1回のリクエストで解決し、
+        (最終 URL, ページタイトル) を返します。
+        キャッシュに有効な結果があればネットワークにはアクセスしません。
+        deadline_at（time.monotonic() の値）までに取得できなかった場合や、締め切りでタイトルを
+        読み切れなかった場合は、ページタイトルをキャッシュしません。
+        """
+        cache = self.reference_cache
+        target_url = redirect_url
+        if cache:
+            found, final_url = cache.get_final_url(redirect_url)
+            if found:
+                if final_url is None:
+                    return None, "（リダイレクト失敗）"
+                page = cache.get_page(final_url)
+                if page:
+                    return final_url, page[0]
+                # 最終 URL が分かっていればリダイレクトを経由せず直接取得する
+                target_url = final_url
+        try:
+            fetched = self.fetch_title(target_url, deadline_at=deadline_at)
+            if fetched is None:
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    return None, "（時間内に取得できませんでした）"
+                if cache:
+                    cache.set_final_url(redirect_url, None)
+                return None, "（リダイレクト失敗）"
+            final_url, status_code, page = fetched
+            if page is not None and page.truncated:
+                # 途中までしか読めていないため「タイトルなし」として記録しない（リダイレクト先のみ記録する）
+                if cache:
+                    cache.set_final_url(redirect_url, final_url)
+                return final_url, "（時間内に取得できませんでした）"
+            if status_code != 200:
+                page_title = f"（取得できませんでした: {status_code}）"
+            else:
+                page_title = page.title or "（タイトルなし）"
+            if cache:
+                cache.set_final_url(redirect_url, final_url)
+                cache.set_page(final_url, page_title, status_code)
+            return final_url, page_title
+        except Exception as e:
+            return None, f"（エラー: {str(e)}）"
+
+    def build_summary_prompt(self, original_text, postings=5):
+        return f"""
+        以下の文章をもとに、求人情報の各案件を分かりやすく整理し、次のフォーマットで必ず{postings}件にまとめて出力してください。
         回答は必ずプレーンテキスト形式で、マークダウン記法や装飾は一切使用せず、絵文字などを用いた視認性の良い形式で返してください。
     
         ※注意：
@@ -90,7 +212,7 @@ class GeminiSlackPoster:
         【要件】
         - 最初に「本日のデータサイエンス系障がい者求人はこちらです：」と記載してください。
         - 各求人案件について、企業名、勤務地（リモート勤務の可否を含む）、職種、給与、勤務形態、特徴を必ず明記してください。
-        - 求人は必ず5件表示する様にしてください。
+        - 求人は必ず{postings}件表示する様にしてください。
         - 年齢制限がある場合はそれを記載してください。
         - 各社が採用している障害の種別や割合、具体的な採用人数に関する情報があれば、それも明記してください。
         - 文中の引用番号（[1], [2], [7] など）は可能な限り維持してください。
@@ -101,40 +223,84 @@ class GeminiSlackPoster:
         {original_text}
         """
 
-        summary_response = self.client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=summary_prompt
-        )
+    def summary_client(self, original_text, postings=5):
+        summary_prompt = self.build_summary_prompt(original_text, postings)
+        with self.tracer.stage("gemini.summary", model=GEMINI_MODEL) as event:
+            summary_response = self.gemini_cache.get_or_generate(
+                self.quota.wrap("summary", lambda: self.client.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=summary_prompt
+                ), summary_prompt, event=event),
+                GEMINI_MODEL, summary_prompt, event=event
+            )
+            self.tracer.record_gemini_response(event, summary_response)
         return summary_response.text.strip()
 
-    def serch_references(self, response):
-        if not response.candidates[0].grounding_metadata:
+    def stream_summary(self, original_text, postings=5):
+        """summary_client のストリーミング版。生成された要約テキストの断片を順に返します。"""
+        summary_prompt = self.build_summary_prompt(original_text, postings)
+        with self.tracer.stage("gemini.summary", model=GEMINI_MODEL, stream=True) as event:
+            start = time.perf_counter()
+            pieces = self.gemini_cache.stream_or_replay(
+                self.quota.wrap("summary", lambda: self.client.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=summary_prompt
+                ), summary_prompt, stream=True, event=event),
+                GEMINI_MODEL, summary_prompt, event=event,
+                on_complete=lambda response: self.tracer.record_gemini_response(event, response)
+            )
+            for piece in pieces:
+                event.setdefault("first_chunk_ms", round((time.perf_counter() - start) * 1000, 1))
+                yield piece
+
+    def serch_references(self, response, deadline=None):
+        """
+        grounding_chunks の参照 URL を共有セッション上で並列に解決します。
+        response には応答のリストも指定でき、その場合は全応答の参照を URL の重複を除いてまとめます。
+        deadline（秒、省略時は self.reference_deadline）までに解決できなかった参照は
+        元の URL のまま出力し、出力順は常にチャンク番号順に揃えます。
+        各リクエストのタイムアウトも締め切りまでの残り時間に縮めるため、
+        締め切り後に取得を続けるスレッドが残ってプロセスの終了を遅らせることはありません。
+        """
+        responses = response if isinstance(response, list) else [response]
+        metadata = [r.candidates[0].grounding_metadata for r in responses if r.candidates[0].grounding_metadata]
+        if not metadata:
             return "検索結果情報 (grounding_metadata) がありませんでした。"
-        grounding_chunks = response.candidates[0].grounding_metadata.grounding_chunks
+        grounding_chunks = [chunk for m in metadata for chunk in (m.grounding_chunks or [])]
         if not grounding_chunks:
             return "URLが取得できませんでした。ご自身でも調べてみて下さい。"
+        if deadline is None:
+            deadline = self.reference_deadline
+
+        redirect_urls = list(dict.fromkeys(chunk.web.uri for chunk in grounding_chunks))
+        with self.tracer.stage("references", grounding_chunks=len(redirect_urls)) as event:
+            executor = ThreadPoolExecutor(max_workers=max(1, min(self.reference_workers, len(redirect_urls))))
+            deadline_at = time.monotonic() + deadline
+            futures = [executor.submit(self.resolve_reference, url, deadline_at) for url in redirect_urls]
+            done, not_done = wait(futures, timeout=deadline)
+            # 締め切りを過ぎたリクエストの完了は待たない
+            executor.shutdown(wait=False, cancel_futures=True)
+            event["unresolved"] = len(not_done)
+        if not_done:
+            print(f"⚠️ {len(not_done)} 件の参照サイトが {deadline} 秒以内に解決できませんでした。")
+
         ref_lines = ["*取得した参照サイト一覧:*"]
-        for i, chunk in enumerate(grounding_chunks, start=1):
-            redirect_url = chunk.web.uri
-            final_url = self.get_final_url(redirect_url)
-            if final_url is None:
-                page_title = "（リダイレクト失敗）"
+        for i, (redirect_url, future) in enumerate(zip(redirect_urls, futures), start=1):
+            if future in done:
+                final_url, page_title = future.result()
             else:
-                try:
-                    resp = self.robust_get(final_url)
-                    if resp is None:
-                        page_title = "（取得失敗）"
-                    elif resp.status_code == 200:
-                        soup = BeautifulSoup(resp.text, "html.parser")
-                        page_title = soup.title.string if soup.title else "（タイトルなし）"
-                    else:
-                        page_title = f"（取得できませんでした: {resp.status_code}）"
-                except Exception as e:
-                    page_title = f"（エラー: {str(e)}）"
-            ref_lines.append(f"{i}. <{final_url}|{page_title}>")
+                final_url, page_title = None, "（時間内に取得できませんでした）"
+            ref_lines.append(f"{i}. <{final_url or redirect_url}|{page_title}>")
+        if self.reference_cache:
+            self.reference_cache.save()
         return "\n".join(ref_lines)
 
-    def search_info(self, user_query):
+    def grounded_search(self, user_query, stateless=False):
+        """
+        Google 検索付きで求人情報を調べ、(検索結果のテキスト, 応答) を返します。
+        stateless=True の場合は検索用チャットの履歴を使わない独立した generate_content を発行し、
+        結果を統合しやすいよう求人ごとの出力形式も指定します（複数クエリの並列検索で使用）。
+        """
         # 追加指示：求人掲載サイト（Indeed、求人ボックス、障害者転職エージェント ハッピー、スグJOB など）の名称は出力結果に含めず、
         # 実際に求人を募集している企業の情報のみを対象に情報を生成するように指示する。
         enhanced_query = (
@@ -143,41 +309,159 @@ class GeminiSlackPoster:
             "出力結果が『複数の企業』となっている場合は、特に勤務地が「大阪府梅田本社オフィス」の様に具体的に示されている企業を代表例として特定し、その企業のみの情報を出力してください。\n"
             "各求人案件において、勤務地、職種、給与、勤務形態、特徴などの重要な情報が『記載なし』または『情報なし』となっている案件は、出力結果に含めないでください。"
         )
-        response = self.search_client.send_message(enhanced_query)
+        with self.tracer.stage("gemini.search", model=GEMINI_MODEL, stateless=stateless) as event:
+            if stateless:
+                enhanced_query += "\n" + STRUCTURED_SEARCH_FORMAT
+                response = self.gemini_cache.get_or_generate(
+                    self.quota.wrap("summary", lambda: self.client.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=enhanced_query,
+                        config=SEARCH_CONFIG
+                    ), enhanced_query, event=event),
+                    GEMINI_MODEL, enhanced_query, SEARCH_CONFIG, event=event
+                )
+            else:
+                response = self.gemini_cache.send_message(
+                    self.search_client, GEMINI_MODEL, enhanced_query, SEARCH_CONFIG, event=event,
+                    send=self.quota.wrap("summary", self.search_client.send_message, enhanced_query, event=event)
+                )
+            self.tracer.record_gemini_response(event, response)
         original_text = ""
         for part in response.candidates[0].content.parts:
             if part.text:
                 original_text += part.text + "\n"
-        summary_text = self.summary_client(original_text)
-        references_text = self.serch_references(response)
-        return summary_text, references_text, response
+        return original_text, response
+
+    def fan_out_search(self, queries):
+        """
+        複数のクエリ（職種別・地域別など）を最大 self.search_concurrency 並列で検索し、
+        (統合した検索結果のテキスト, 応答のリスト, 要約する件数) を返します。
+        各クエリの求人は会社名と職種で重複を除いて1つの番号付きリストにまとめ、
+        求人の形式で解析できなかった検索結果はそのままのテキストを後ろに付けます。
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.search_concurrency, len(queries)))) as executor:
+            futures = [executor.submit(self.grounded_search, query, True) for query in queries]
+        results = []
+        for query, future in zip(queries, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"❌ クエリ「{query}」の検索に失敗しました: {e}")
+        if not results:
+            raise RuntimeError("すべてのクエリの検索に失敗しました。")
+
+        postings = []
+        unparsed = []
+        for text, _ in results:
+            parsed = parse_summary_postings(text)
+            postings.extend(parsed)
+            if not parsed:
+                unparsed.append(text.strip())
+        merged = dedupe_postings(postings)
+        print(f"🔎 {len(results)}/{len(queries)} 件のクエリから {len(postings)} 件の求人を取得し、"
+              f"重複を除いて {len(merged)} 件にまとめました。")
+
+        blocks = [f"{i}. {posting.to_text()}" for i, posting in enumerate(merged, start=1)]
+        original_text = "\n\n".join(blocks + unparsed)
+        count = min(len(merged), MAX_SUMMARY_POSTINGS) if merged else 5
+        return original_text, [response for _, response in results], count
+
+    def run_searches(self, query):
+        """
+        query（文字列またはクエリのリスト）を検索し、(検索結果のテキスト, 応答のリスト, 要約する件数) を返します。
+        クエリが1つの場合は従来どおり検索用チャットで検索します。
+        """
+        queries = [query] if isinstance(query, str) else list(query)
+        if len(queries) == 1:
+            original_text, response = self.grounded_search(queries[0])
+            return original_text, [response], 5
+        return self.fan_out_search(queries)
+
+    def search_info(self, user_query):
+        original_text, responses, postings = self.run_searches(user_query)
+        summary_text = self.summary_client(original_text, postings)
+        references_text = self.serch_references(responses)
+        return summary_text, references_text, responses
 
     def post_message_to_slack(self, message):
-        headers = {
-            "Authorization": f"Bearer {self.slack_bot_token}",
-            "Content-Type": "application/json"
-        }
-        today_date = datetime.now().strftime("%Y-%m-%d")
-        for channel in self.slack_channel_id:
-            payload = {
-                "channel": channel,
-                "text": message,
-                "unfurl_links": False,
-                "unfurl_media": False,
-            }
-            response = requests.post("https://slack.com/api/chat.postMessage", headers=headers, json=payload)
-            data = response.json()
-            if data.get("ok"):
-                print(f"✅ {today_date} に Slack へメッセージを投稿しました！(チャンネル: {channel})")
-            else:
-                print(f"❌ Slack への投稿に失敗しました: {data.get('error')} (チャンネル: {channel})")
-                print("詳細:", data)
+        """全チャンネルへ投稿し、チャンネルごとの DeliveryResult のリストを返します。"""
+        return self.slack.post_message(message, label="メッセージ")
 
-    def post_search_result(self, query):
-        summary, _, response = self.search_info(query)
-        caution_text = "※これは本日のウェブサイト情報を Gemini が検索してまとめたものであり、内容の正確性を保証するものではありません。"
-        slack_message = f"*要約結果:*\n{summary}\n\n{caution_text}"
+    @staticmethod
+    def completed_postings(text):
+        """
+        生成途中の要約のうち、書き終わった求人ブロック（空行で閉じたもの）までを返します。
+        求人ブロックがまだ1件も完成していなければ None を返します。
+        """
+        cut = text.rfind("\n\n")
+        if cut < 0 or not POSTING_HEADER_RE.search(text[:cut]):
+            return None
+        return text[:cut].strip()
+
+    def post_search_result(self, query, stream=None):
+        """
+        求人情報を検索・要約して Slack に投稿します。
+        query にクエリのリストを渡すと並列に検索し、重複を除いた求人をまとめて1回で要約します。
+        stream=True（省略時は self.stream）の場合、最初の求人ブロックが書き上がった時点でプレースホルダーを投稿し、
+        生成が進むにつれて chat.update で書き換え、最後に注意書きを付けた最終版にします。
+        """
+        if stream is None:
+            stream = self.stream
+        if not stream:
+            summary, _, _ = self.search_info(query)
+            slack_message = f"*要約結果:*\n{summary}\n\n{CAUTION_TEXT}"
+            self.save_summary(summary, slack_message)
+            print("投稿内容:\n", slack_message)
+            self.post_message_to_slack(slack_message)
+            if self.reference_cache:
+                self.reference_cache.print_stats()
+            return
+
+        original_text, responses, postings = self.run_searches(query)
+        # 参照サイトの解決は要約の生成・投稿と並行して進める
+        executor = ThreadPoolExecutor(max_workers=1)
+        references = executor.submit(self.serch_references, responses)
+        executor.shutdown(wait=False)
+
+        def render_partial(text):
+            blocks = self.completed_postings(text)
+            return f"*要約結果:*\n{blocks}\n\n{STREAMING_NOTICE}" if blocks else None
+
+        interrupted = {}
+
+        def render_error(text):
+            # 生成が途中で失敗した場合は、書き終わった求人ブロックだけを掲載して確定させる
+            blocks = self.completed_postings(text) or ""
+            interrupted["summary"] = blocks
+            interrupted["message"] = f"*要約結果:*\n{blocks}\n\n{STREAM_ERROR_NOTICE}\n\n{CAUTION_TEXT}"
+            return interrupted["message"]
+
+        try:
+            summary, _ = self.slack.post_stream(
+                self.stream_summary(original_text, postings),
+                render_partial,
+                lambda text: f"*要約結果:*\n{text.strip()}\n\n{CAUTION_TEXT}",
+                label="メッセージ",
+                render_error=render_error
+            )
+        except Exception:
+            if interrupted.get("summary"):
+                # Slack に掲載した内容と data/reqruit.txt・求人フィードを揃える
+                self.save_summary(interrupted["summary"], interrupted["message"])
+            raise
+        summary = summary.strip()
+        slack_message = f"*要約結果:*\n{summary}\n\n{CAUTION_TEXT}"
+        print("投稿内容:\n", slack_message)
+        self.save_summary(summary, slack_message)
+        references.result()
+        if self.reference_cache:
+            self.reference_cache.print_stats()
+
+    def save_summary(self, summary, slack_message):
+        """投稿した要約を data/reqruit.txt に保存し、構造化した求人レコードをフィードに追記します。"""
         with open(MESSAGE_FILE, "w", encoding="utf-8") as f:
             f.write(slack_message)
-        print("投稿内容:\n", slack_message)
-        self.post_message_to_slack(slack_message)
+        # 企業分析モードが再解析しなくて済むよう、構造化した求人レコードもフィードに追記する
+        source_date = datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d")
+        count = append_postings(parse_summary_postings(summary, source_date), JOB_FEED_FILE)
+        print(f"求人フィード {JOB_FEED_FILE} に {count} 件追記しました。")
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+TRACE_DIR = "data/traces"  # 実行ごとのトレース（JSONL）の出力先
+TRACE_MAX_FILES = 200      # 残しておくトレースの件数（古いものから削除）
+
+class Tracer:
+    """
+    Gemini 呼び出し・HTTP 取得・Slack 投稿などの処理時間やトークン数を記録するクラス。
+    stage() で囲んだ処理ごとに1件のイベントを記録し、実行の最後に JSONL へ書き出して
+    ステージ別の集計表を表示します。複数スレッドから同時に使用できます。
+    トレースは新しいものから max_trace_files 件だけ残します。
+    """
+    def __init__(self, mode=None, max_trace_files=TRACE_MAX_FILES):
+        self._lock = threading.Lock()
+        self.max_trace_files = max_trace_files
+        self.reset(mode)
+
+    def reset(self, mode=None):
+        """新しい run_id で記録をやり直します（デーモンで実行ごとにトレースを分けるため）。"""
+        with self._lock:
+            self.mode = mode
+            self.run_id = datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+            self.events = []
+
+    @contextmanager
+    def stage(self, name, **attrs):
+        """
+        処理を計測するコンテキストマネージャ。yield されるイベント辞書に
+        retries や bytes などの属性を追加できます。例外は記録した上でそのまま送出します。
+        """
+        event = {"stage": name, "retries": 0, **attrs}
+        event["started_at"] = datetime.now(ZoneInfo("Asia/Tokyo")).isoformat()
+        start = time.perf_counter()
+        try:
+            yield event
+            event.setdefault("ok", True)
+        except BaseException as e:
+            event["ok"] = False
+            event["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            event["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            with self._lock:
+                self.events.append(event)
+
+    @staticmethod
+    def record_gemini_response(event, response):
+        """Gemini の応答から使用トークン数・グラウンディング件数・応答サイズをイベントに記録します。"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            event["prompt_tokens"] = usage.prompt_token_count or 0
+            event["response_tokens"] = usage.candidates_token_count or 0
+            event["total_tokens"] = usage.total_token_count or 0
+        candidates = getattr(response, "candidates", None) or []
+        if candidates:
+            metadata = candidates[0].grounding_metadata
+            event["grounding_chunks"] = len(metadata.grounding_chunks or []) if metadata else 0
+            parts = candidates[0].content.parts if candidates[0].content else []
+            event["bytes"] = sum(len((part.text or "").encode("utf-8")) for part in parts or [])
+
+    def write_jsonl(self, trace_dir=TRACE_DIR):
+        """イベントを data/traces/<run_id>.jsonl に書き出し、そのパスを返します。"""
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.run_id}.jsonl")
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            for event in events:
+                record = {"run_id": self.run_id, "mode": self.mode, **event}
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.prune(trace_dir)
+        return path
+
+    def prune(self, trace_dir=TRACE_DIR):
+        """max_trace_files を超えた分のトレースを更新日時の古い順に削除します。"""
+        try:
+            names = [n for n in os.listdir(trace_dir) if n.endswith(".jsonl")]
+        except OSError:
+            return
+        if len(names) <= self.max_trace_files:
+            return
+        paths = sorted((os.path.join(trace_dir, n) for n in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_trace_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def summarize(self):
+        """ステージ名ごとの集計（件数・合計/最大時間・再試行・利用枠の待ち時間・トークン・バイト数）を返します。"""
+        summary = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            row = summary.setdefault(event["stage"], {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "retries": 0, "wait_ms": 0.0, "tokens": 0, "bytes": 0,
+            })
+            row["count"] += 1
+            row["errors"] += 0 if event.get("ok") else 1
+            row["total_ms"] += event["wall_ms"]
+            row["max_ms"] = max(row["max_ms"], event["wall_ms"])
+            row["retries"] += event.get("retries", 0)
+            row["wait_ms"] += event.get("quota_wait_ms", 0)
+            row["tokens"] += event.get("total_tokens", 0)
+            row["bytes"] += event.get("bytes", 0)
+        return summary
+
+    def print_summary(self):
+        summary = self.summarize()
+        if not summary:
+            return
+        print(f"⏱️ ステージ別の計測結果（run_id: {self.run_id}）")
+        header = f"{'stage':<24}{'count':>6}{'errors':>7}{'total_ms':>11}{'avg_ms':>10}{'max_ms':>10}{'retries':>8}{'wait_ms':>10}{'tokens':>9}{'bytes':>10}"
+        print(header)
+        print("-" * len(header))
+        for name, row in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+            avg = row["total_ms"] / row["count"]
+            print(f"{name:<24}{row['count']:>6}{row['errors']:>7}{row['total_ms']:>11.1f}{avg:>10.1f}"
+                  f"{row['max_ms']:>10.1f}{row['retries']:>8}{row['wait_ms']:>10.1f}{row['tokens']:>9}{row['bytes']:>10}")
+
+    def finish(self, trace_dir=TRACE_DIR):
+        """トレースを書き出し、集計表を表示します。"""
+        if not self.events:
+            return None
+        path = self.write_jsonl(trace_dir)
+        self.print_summary()
+        print(f"📝 トレースを {path} に保存しました。")
+        return path
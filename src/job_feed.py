@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import tempfile
+import unicodedata
+from dataclasses import dataclass, asdict, fields
+
+from src.company_index import normalize_company_name, is_valid_company_name
+
+JOB_FEED_FILE = "data/job_feed.jsonl"  # summary モードが追記する構造化求人フィード
+JOB_FEED_CURSOR_FILE = "data/job_feed_cursor.json"  # 企業分析が処理し終えたフィードの位置（バイト数）
+
+# 要約テキスト中の各項目の絵文字ラベル → JobPosting のフィールド名
+FIELD_LABELS = {
+    "📍": "location",
+    "💼": "role",
+    "💰": "salary",
+    "⏰": "employment_type",
+    "🔍": "features",
+}
+HEADER_RE = re.compile(r"^\s*(\d+)\.\s*(.+)$")
+# 求人の重複判定で職種を比較する際に無視する文字（空白・括弧・記号）
+ROLE_IGNORED_CHARS_RE = re.compile(r"[\s()（）\[\]［］【】・/／、,]")
+# 項目の値が実質的に空であることを表す表記
+EMPTY_VALUES = {"", "記載なし", "情報なし", "不明"}
+
+@dataclass
+class JobPosting:
+    """求人フィードの1件分のレコード。"""
+    company: str
+    location: str = ""
+    role: str = ""
+    salary: str = ""
+    employment_type: str = ""
+    features: str = ""
+    source_date: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in names})
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_text(self):
+        """企業分析のプロンプトに渡すため、要約と同じ形式のテキストに戻します。"""
+        return "\n".join([
+            f"🏢 {self.company}",
+            f"    📍 勤務地: {self.location}",
+            f"    💼 職種: {self.role}",
+            f"    💰 給与: {self.salary}",
+            f"    ⏰ 勤務形態: {self.employment_type}",
+            f"    🔍 特徴: {self.features}",
+        ])
+
+def parse_summary_postings(summary_text, source_date=""):
+    """
+    summary_client が返す要約テキスト（「1. 🏢 会社名」＋絵文字ラベル付きの各項目）を
+    JobPosting のリストに変換します。会社名のない案件は除外します。
+    """
+    postings = []
+    current = None
+    for line in summary_text.splitlines():
+        header = HEADER_RE.match(line)
+        if header and "🏢" in header.group(2):
+            company = header.group(2).replace("🏢", "").strip()
+            # 1行目にハイフン以降の職種が残っている場合は会社名から外す
+            company = company.split(" - ", 1)[0].strip()
+            current = JobPosting(company=company, source_date=source_date)
+            postings.append(current)
+            continue
+        if current is None:
+            continue
+        stripped = line.strip()
+        for label, name in FIELD_LABELS.items():
+            if stripped.startswith(label):
+                value = stripped[len(label):].strip()
+                # "勤務地: ..." のような項目名を取り除く
+                value = re.sub(r"^[^:：]{1,8}[:：]\s*", "", value)
+                setattr(current, name, value)
+                break
+    return [p for p in postings if p.company]
+
+def posting_key(posting):
+    """
+    求人の重複判定に使うキー（正規化した会社名, 正規化した職種）を返します。
+    会社名は法人格・括弧書き・全角半角の違いを無視し、職種は空白や括弧を無視して比較します。
+    """
+    role = ROLE_IGNORED_CHARS_RE.sub("", unicodedata.normalize("NFKC", posting.role).lower())
+    return normalize_company_name(posting.company), role
+
+def dedupe_postings(postings):
+    """
+    会社名と職種が同じ求人を1件にまとめ、伏せ字などの会社名として扱えない案件を除外します。
+    出現順は保ち、先に出た求人で「記載なし」などになっている項目は後から出た求人の値で補います。
+    """
+    merged = {}
+    for posting in postings:
+        if not is_valid_company_name(posting.company):
+            continue
+        key = posting_key(posting)
+        if key not in merged:
+            merged[key] = JobPosting.from_dict(posting.to_dict())
+            continue
+        kept = merged[key]
+        for name in FIELD_LABELS.values():
+            if getattr(kept, name).strip() in EMPTY_VALUES and getattr(posting, name).strip() not in EMPTY_VALUES:
+                setattr(kept, name, getattr(posting, name))
+    return list(merged.values())
+
+def append_postings(postings, path=JOB_FEED_FILE):
+    """求人レコードをフィードの末尾に追記します（既存の行は書き直しません）。"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for posting in postings:
+            f.write(json.dumps(posting.to_dict(), ensure_ascii=False) + "\n")
+    return len(postings)
+
+def iter_feed(path=JOB_FEED_FILE, start=0):
+    """
+    フィードを start バイト目から1行ずつ読み、(行の先頭のバイト位置, JobPosting) を順に返すジェネレータ。
+    壊れた行は読み飛ばします。
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for raw in f:
+            line_start, offset = offset, offset + len(raw)
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                yield line_start, JobPosting.from_dict(json.loads(line))
+            except (ValueError, TypeError):
+                print(f"警告: 求人フィードの不正な行を読み飛ばします: {line[:80]}")
+
+def iter_postings(path=JOB_FEED_FILE, start=0):
+    """フィードを start バイト目から1行ずつ読み、JobPosting を順に返すジェネレータ。"""
+    for _, posting in iter_feed(path, start):
+        yield posting
+
+
+class JobFeedBacklog:
+    """
+    求人フィードのうち、企業分析がまだ処理し終えていない部分（カーソル以降）の求人。
+    フィードは追記のみで毎日コミットされるため、処理済みの位置をカーソルファイルに記録しておき、
+    次回はそこから読み始めます（過去の求人を毎回先頭から走査し直さない）。
+    カーソルより後の求人は古い順に分析するため、分析が追いつかない日があっても取りこぼしません。
+    """
+    def __init__(self, path=JOB_FEED_FILE, cursor_file=JOB_FEED_CURSOR_FILE):
+        self.path = path
+        self.cursor_file = cursor_file
+        self.start = self.load_cursor()
+        self.end = os.path.getsize(path) if os.path.exists(path) else 0
+        self.entries = [entry for entry in iter_feed(path, self.start) if entry[0] < self.end]
+
+    def __iter__(self):
+        return (posting for _, posting in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load_cursor(self):
+        """カーソルを読み込みます。フィードが短くなっている（作り直された）場合は先頭から読み直します。"""
+        try:
+            with open(self.cursor_file, "r", encoding="utf-8") as f:
+                offset = int(json.load(f).get("offset", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            return 0
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return offset if 0 <= offset <= size else 0
+
+    def advance(self, pending_company=None):
+        """
+        pending_company（まだ分析し終えていない最初の求人の会社名）の行の手前までカーソルを進めます。
+        None の場合は読み込んだ範囲の末尾まで進めます。進めた位置を返します。
+        """
+        offset = self.end
+        if pending_company is not None:
+            for line_start, posting in self.entries:
+                if posting.company == pending_company:
+                    offset = line_start
+                    break
+        if offset == self.start:
+            return offset
+        directory = os.path.dirname(self.cursor_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".job_feed_cursor.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"offset": offset}, f)
+            os.replace(tmp_path, self.cursor_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.start = offset
+        return offset
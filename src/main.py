@@ -1,24 +1,182 @@
 import os
 import sys
-import json
-import hashlib
+import time
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from src.gemini_slack_poster import GeminiSlackPoster
-from src.company_recruit_analysis import CompanyRecruitAnalysis
+
+# 重いライブラリ（google.genai・requests など）は各モードで必要になった時点で読み込む
 
 # ファイルパスの設定
 REQ_FILE = "data/reqruit.txt"             # 入力ファイル（求人情報全体）
-ANALYSIS_RESULTS_FILE = "data/analysis_results.json"  # 既存の企業分析結果の保存先
+ANALYSIS_RESULTS_FILE = "data/analysis_results.json"  # 従来形式の企業分析結果（初回のみストアへ移行）
+ANALYSIS_STORE_FILE = "data/analysis_results.db"      # 企業分析結果の保存先（SQLite、ローカルのみ）
+ANALYSIS_LOG_FILE = "data/analysis_log.jsonl"          # 企業分析結果の追記ログ（コミットされ、ストアの復元に使う）
+ANALYSIS_SEARCH_INDEX_FILE = "data/analysis_search.db" # 企業分析の全文検索インデックス
 SUMMARY_OUTPUT_FILE = "data/summary_result.txt"       # 求人要約結果の保存先
 
+# summary モードの検索クエリの対象（--query-variants で職種別・地域別などに複数指定すると並列に検索する）
+DEFAULT_QUERY_VARIANT = "データサイエンス系"
+
+# daemon モードの実行時刻（日本時間）
+SUMMARY_SCHEDULE = [(9, 0)]
+ANALYSIS_SCHEDULE = [(hour, 0) for hour in range(10, 15)]
+
+def seconds_until_end_of_day():
+    now = datetime.now(ZoneInfo('Asia/Tokyo'))
+    end_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return int((end_of_day - now).total_seconds())
+
+def build_summary_queries(variants=None):
+    """
+    当日の日付入りの検索クエリを variants（「データエンジニア」「大阪府のデータサイエンス系」など）ごとに作ります。
+    variants を省略した場合は従来どおりデータサイエンス系の1クエリです。
+    """
+    today_date = datetime.now(ZoneInfo('Asia/Tokyo')).strftime("%Y-%m-%d")
+    return [
+        f"{today_date}の障碍者枠の{variant}求人を調査してください。可能であれば5件探してください。文章はですます調でお願いします。"
+        for variant in (variants or [DEFAULT_QUERY_VARIANT])
+    ]
+
+def run_summary(poster, gemini_cache, cache_ttl=None, variants=None):
+    """求人要約の投稿（GeminiSlackPoster クラスを利用）"""
+    # 日付入りのクエリなので、既定では当日（日本時間）の終わりまでキャッシュを有効にする
+    gemini_cache.ttl = cache_ttl or seconds_until_end_of_day()
+    queries = build_summary_queries(variants)
+    poster.post_search_result(queries[0] if len(queries) == 1 else queries)
+
+def load_jobs():
+    """
+    企業分析の対象となる求人を返します。
+    構造化された求人フィードがあれば前回処理し終えた位置以降の求人（JobFeedBacklog）を、
+    なければ要約テキストを返します。どちらもない場合は None を返します。
+    """
+    from src.job_feed import JOB_FEED_FILE, JobFeedBacklog
+    if os.path.exists(JOB_FEED_FILE):
+        return JobFeedBacklog(JOB_FEED_FILE)
+    if os.path.exists(REQ_FILE):
+        with open(REQ_FILE, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+def ensure_analysis_store():
+    """
+    ストアがまだ無ければ従来の JSON から一度だけ移行し、追記ログのうちストアに未反映の記録を取り込みます
+    （ワークフローでは毎回、コミット済みの JSON とログからストアを作り直します）。
+    """
+    from src.analysis_store import SqliteAnalysisStore, migrate_json_to_store, replay_analysis_log
+    if not os.path.exists(ANALYSIS_STORE_FILE) and os.path.exists(ANALYSIS_RESULTS_FILE):
+        migrate_json_to_store(ANALYSIS_RESULTS_FILE, ANALYSIS_STORE_FILE)
+    if os.path.exists(ANALYSIS_LOG_FILE):
+        with SqliteAnalysisStore(ANALYSIS_STORE_FILE) as store:
+            replayed = replay_analysis_log(store, ANALYSIS_LOG_FILE)
+        if replayed:
+            print(f"✅ {replayed} 件の分析結果を {ANALYSIS_LOG_FILE} からストアに取り込みました。")
+
+def run_analysis(analyzer, req_text, batch=False, max_companies=5, concurrency=3):
+    """企業分析（未分析の求人について、同一の会社名が重複しないようにする）"""
+    from src.analysis_store import SqliteAnalysisStore
+    from src.job_feed import JobFeedBacklog
+
+    ensure_analysis_store()
+    with SqliteAnalysisStore(ANALYSIS_STORE_FILE, log_file=ANALYSIS_LOG_FILE) as store:
+        if batch:
+            analyzer.run_analysis_batch(req_text, store, max_companies=max_companies, concurrency=concurrency)
+        else:
+            analyzer.run_analysis_for_one(req_text, store)
+        if isinstance(req_text, JobFeedBacklog):
+            # 分析済み・対象外の求人の分だけカーソルを進め、次回はまだ分析していない最初の求人から読む
+            pending = analyzer.find_unprocessed_jobs(req_text, store, limit=1, quiet=True)
+            offset = req_text.advance(pending[0][0] if pending else None)
+            print(f"求人フィードは {offset} バイト目まで処理済みです。")
+
+def run_search(query, limit=10):
+    """蓄積された企業分析を全文検索して結果を表示します（API キーは不要）。"""
+    from src.analysis_store import SqliteAnalysisStore
+    from src.analysis_search import AnalysisSearchIndex, print_hits
+
+    ensure_analysis_store()
+    with SqliteAnalysisStore(ANALYSIS_STORE_FILE) as store, AnalysisSearchIndex(ANALYSIS_SEARCH_INDEX_FILE) as index:
+        # 索引に未反映の分析結果があれば、その分だけ追加する
+        added = index.sync(store)
+        if added:
+            print(f"📚 {added} 件の分析結果を検索インデックスに追加しました。")
+        start = time.perf_counter()
+        hits = index.search(query, limit=limit, store=store)
+        print_hits(query, hits, (time.perf_counter() - start) * 1000)
+
+def run_daemon(args, poster, analyzer, gemini_cache, tracer):
+    """
+    クライアントと HTTP セッションを保持したまま、要約ジョブと企業分析ジョブを
+    日本時間のスケジュールで実行し続けます。
+    """
+    from src.scheduler import Scheduler
+
+    def summary_job():
+        tracer.reset("summary")
+        poster.reset_chat()
+        try:
+            run_summary(poster, gemini_cache, args.gemini_cache_ttl, args.query_variants)
+        finally:
+            tracer.finish()
+
+    def analysis_job():
+        req_text = load_jobs()
+        if req_text is None:
+            print(f"❌ ファイル {REQ_FILE} が見つかりません。")
+            return
+        tracer.reset("analysis")
+        analyzer.reset_chat()
+        gemini_cache.ttl = args.gemini_cache_ttl or 24 * 60 * 60
+        try:
+            run_analysis(analyzer, req_text)
+        finally:
+            tracer.finish()
+
+    scheduler = Scheduler()
+    scheduler.add_job("summary", SUMMARY_SCHEDULE, summary_job)
+    scheduler.add_job("analysis", ANALYSIS_SCHEDULE, analysis_job)
+    if not scheduler.run():
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description="Recruitment Analysis System")
-    parser.add_argument("--mode", choices=["summary", "analysis"], required=True,
-                        help="実行モード。summary: 求人要約投稿、analysis: 重複しない求人のうち先頭の1件を企業分析して Slack に投稿")
+    parser.add_argument("--mode", choices=["summary", "analysis", "analysis-batch", "daemon", "search"], required=True,
+                        help="実行モード。summary: 求人要約投稿、analysis: 重複しない求人のうち先頭の1件を企業分析して Slack に投稿、"
+                             "analysis-batch: 未分析の求人をまとめて並列に企業分析して Slack に投稿、"
+                             "daemon: 常駐して summary（9時）と analysis（10時～14時の毎時）を日本時間で定刻実行、"
+                             "search: 蓄積された企業分析を全文検索")
+    parser.add_argument("--max-companies", type=int, default=5,
+                        help="analysis-batch モードで1回に分析する最大企業数")
+    parser.add_argument("--concurrency", type=int, default=3,
+                        help="analysis-batch モードで同時に実行する Gemini リクエスト数")
+    parser.add_argument("--no-gemini-cache", action="store_true",
+                        help="Gemini の応答キャッシュを使わずに必ず API を呼び出す")
+    parser.add_argument("--gemini-cache-ttl", type=int, default=None,
+                        help="Gemini の応答キャッシュの有効期限（秒）。省略時は summary が当日中、analysis が24時間")
+    parser.add_argument("--no-gemini-quota", action="store_true",
+                        help="Gemini の利用枠の台帳（data/gemini_quota.json）を使わずに呼び出す")
+    parser.add_argument("--gemini-rpm", type=int, default=10, help="Gemini の1分あたりのリクエスト数の上限")
+    parser.add_argument("--gemini-tpm", type=int, default=1_000_000, help="Gemini の1分あたりのトークン数の上限")
+    parser.add_argument("--gemini-rpd", type=int, default=1500, help="Gemini の1日あたりのリクエスト数の上限")
+    parser.add_argument("--stream", action="store_true",
+                        help="summary / analysis モードで、生成中の内容を Slack のメッセージに段階的に反映する")
+    parser.add_argument("--query-variants", type=lambda value: [v.strip() for v in value.split(",") if v.strip()],
+                        default=None,
+                        help="summary モードで並列に検索するクエリの対象（カンマ区切り。例: \"データサイエンティスト,データエンジニア,データアナリスト\"）")
+    parser.add_argument("--search-concurrency", type=int, default=3,
+                        help="--query-variants を指定した場合に同時に実行する検索数")
+    parser.add_argument("--query", help="search モードの検索語（例: \"フルリモート or 法定雇用率\"）")
+    parser.add_argument("--limit", type=int, default=10, help="search モードで表示する件数")
     args = parser.parse_args()
 
+    if args.mode == "search":
+        if not args.query:
+            print("❌ --query で検索語を指定してください。")
+            sys.exit(1)
+        run_search(args.query, args.limit)
+        return
+
     # 環境変数の取得
     SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN", "").strip()
     GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "").strip()
@@ -29,25 +187,53 @@ def main():
         print("❌ 必要な環境変数が設定されていません。")
         sys.exit(1)
 
-    if args.mode == "summary":
-        # 求人要約の投稿（GeminiSlackPoster クラスを利用）
-        poster = GeminiSlackPoster(GEMINI_API_KEY, SLACK_BOT_TOKEN, SLACK_CHANNEL_ID)
-        today_date = datetime.now(ZoneInfo('Asia/Tokyo')).strftime("%Y-%m-%d")
-        query = f"{today_date}の障碍者枠のデータサイエンス系求人を調査してください。可能であれば5件探してください。文章はですます調でお願いします。"
-        poster.post_search_result(query)
-    elif args.mode == "analysis":
-        # 企業分析（未分析の求人について、同一の会社名が重複しないようにする）
-        if not os.path.exists(REQ_FILE):
+    if args.mode in ("analysis", "analysis-batch"):
+        req_text = load_jobs()
+        if req_text is None:
             print(f"❌ ファイル {REQ_FILE} が見つかりません。")
             sys.exit(1)
-        with open(REQ_FILE, "r", encoding="utf-8") as f:
-            req_text = f.read()
 
-        analyzer = CompanyRecruitAnalysis(GEMINI_API_KEY, SLACK_BOT_TOKEN, SLACK_CHANNEL_ID)
-        analyzer.run_analysis_for_one(req_text, ANALYSIS_RESULTS_FILE)
-    else:
-        print("❌ 不正なモードです。")
-        sys.exit(1)
+    from src.slack_client import SlackClient
+    from src.gemini_cache import GeminiResponseCache
+    from src.gemini_quota import GeminiQuota
+    from src.instrumentation import Tracer
+
+    tracer = Tracer(args.mode)
+    slack_client = SlackClient(SLACK_BOT_TOKEN, SLACK_CHANNEL_ID, tracer=tracer)
+    gemini_cache = GeminiResponseCache(enabled=not args.no_gemini_cache)
+    if args.gemini_cache_ttl:
+        gemini_cache.ttl = args.gemini_cache_ttl
+    # summary と analysis が同時に動いても上限を超えないよう、利用枠はプロセス間で共有する台帳で管理する
+    quota = GeminiQuota(rpm=args.gemini_rpm, tpm=args.gemini_tpm, rpd=args.gemini_rpd,
+                        enabled=not args.no_gemini_quota)
+
+    poster = analyzer = None
+    if args.mode in ("summary", "daemon"):
+        from src.gemini_slack_poster import GeminiSlackPoster
+        poster = GeminiSlackPoster(GEMINI_API_KEY, SLACK_BOT_TOKEN, SLACK_CHANNEL_ID,
+                                   slack_client=slack_client, gemini_cache=gemini_cache, tracer=tracer,
+                                   stream=args.stream, search_concurrency=args.search_concurrency, quota=quota)
+    if args.mode in ("analysis", "analysis-batch", "daemon"):
+        from src.company_recruit_analysis import CompanyRecruitAnalysis
+        from src.analysis_search import AnalysisSearchIndex
+        analyzer = CompanyRecruitAnalysis(GEMINI_API_KEY, SLACK_BOT_TOKEN, SLACK_CHANNEL_ID,
+                                          slack_client=slack_client, gemini_cache=gemini_cache, tracer=tracer,
+                                          search_index=AnalysisSearchIndex(ANALYSIS_SEARCH_INDEX_FILE),
+                                          stream=args.stream, quota=quota)
+
+    if args.mode == "daemon":
+        run_daemon(args, poster, analyzer, gemini_cache, tracer)
+        return
+
+    try:
+        if args.mode == "summary":
+            run_summary(poster, gemini_cache, args.gemini_cache_ttl, args.query_variants)
+        else:
+            run_analysis(analyzer, req_text, batch=args.mode == "analysis-batch",
+                         max_companies=args.max_companies, concurrency=args.concurrency)
+    finally:
+        # ステージ別の計測結果を data/traces/ に書き出して表示する
+        tracer.finish()
 
 if __name__ == "__main__":
     main()
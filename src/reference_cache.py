@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+REFERENCE_CACHE_FILE = "data/reference_cache.json"  # 参照サイトの解決結果キャッシュ
+
+DAY = 24 * 60 * 60
+
+class ReferenceCache:
+    """
+    グラウンディングの参照サイト解決結果をディスクに永続化するキャッシュクラス。
+    - redirects: リダイレクト URI → 最終 URL
+    - pages: 最終 URL → ページタイトルと HTTP ステータス
+    エントリごとに有効期限を持ち（失敗結果は短い期限）、件数上限を超えると
+    最も使われていないエントリから削除します（LRU）。保存は一時ファイル経由で置き換えるため、
+    途中で中断してもキャッシュファイルが壊れることはありません。
+    """
+    def __init__(self, path=REFERENCE_CACHE_FILE, max_entries=2000,
+                 redirect_ttl=30 * DAY, page_ttl=7 * DAY, failure_ttl=60 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.redirect_ttl = redirect_ttl
+        self.page_ttl = page_ttl
+        self.failure_ttl = failure_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.redirects = OrderedDict()
+        self.pages = OrderedDict()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 参照キャッシュを読み込めませんでした（無視して続行します）: {e}")
+            return
+        now = time.time()
+        # 期限切れのエントリは読み込み時に捨てる
+        for name in ("redirects", "pages"):
+            table = getattr(self, name)
+            for key, entry in data.get(name, {}).items():
+                if entry.get("expires_at", 0) > now:
+                    table[key] = entry
+
+    def save(self):
+        """キャッシュを一時ファイルに書き出してから置き換えます（アトミックな書き込み）。"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"redirects": dict(self.redirects), "pages": dict(self.pages)}
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".reference_cache.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _get(self, table, key):
+        with self._lock:
+            entry = table.get(key)
+            if entry is None or entry["expires_at"] <= time.time():
+                if entry is not None:
+                    del table[key]
+                self.misses += 1
+                return None
+            table.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _set(self, table, key, entry, ttl):
+        entry["expires_at"] = time.time() + ttl
+        with self._lock:
+            table[key] = entry
+            table.move_to_end(key)
+            while len(table) > self.max_entries:
+                table.popitem(last=False)
+
+    def get_final_url(self, redirect_url):
+        """
+        キャッシュ済みの最終 URL を返します。
+        戻り値は (見つかったか, 最終 URL) で、解決に失敗した結果がキャッシュされている場合は (True, None) です。
+        """
+        entry = self._get(self.redirects, redirect_url)
+        if entry is None:
+            return False, None
+        return True, entry["final_url"]
+
+    def set_final_url(self, redirect_url, final_url):
+        ttl = self.redirect_ttl if final_url else self.failure_ttl
+        self._set(self.redirects, redirect_url, {"final_url": final_url}, ttl)
+
+    def get_page(self, final_url):
+        """キャッシュ済みの (ページタイトル, HTTP ステータス) を返します。なければ None。"""
+        entry = self._get(self.pages, final_url)
+        if entry is None:
+            return None
+        return entry["title"], entry["status"]
+
+    def set_page(self, final_url, title, status):
+        ttl = self.page_ttl if status == 200 else self.failure_ttl
+        self._set(self.pages, final_url, {"title": title, "status": status}, ttl)
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        print(f"📦 参照キャッシュ: ヒット {self.hits} 件 / ミス {self.misses} 件（ヒット率 {rate:.1f}%）")
@@ -0,0 +1,155 @@
+import os
+import json
+import signal
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+SCHEDULER_STATE_FILE = "data/scheduler_state.json"  # 各ジョブの最終実行時刻
+SCHEDULER_LOCK_FILE = "data/.scheduler.lock"         # デーモンの多重起動防止用ロック
+TOKYO = ZoneInfo("Asia/Tokyo")
+
+class ScheduledJob:
+    """毎日決まった時刻（日本時間）に実行するジョブ。"""
+    def __init__(self, name, times, func):
+        self.name = name
+        self.times = sorted(times)  # [(時, 分), ...]
+        self.func = func
+        self.last_run = None
+
+    def latest_due(self, now):
+        """now 以前で直近の予定時刻を返します（前日分まで遡ります）。"""
+        for days_ago in (0, 1):
+            day = (now - timedelta(days=days_ago)).date()
+            for hour, minute in reversed(self.times):
+                due = datetime(day.year, day.month, day.day, hour, minute, tzinfo=TOKYO)
+                if due <= now:
+                    return due
+        return None
+
+    def next_due(self, now):
+        """now より後で直近の予定時刻を返します。"""
+        for days_ahead in (0, 1):
+            day = (now + timedelta(days=days_ahead)).date()
+            for hour, minute in self.times:
+                due = datetime(day.year, day.month, day.day, hour, minute, tzinfo=TOKYO)
+                if due > now:
+                    return due
+        return None
+
+
+class Scheduler:
+    """
+    ジョブを日本時間のスケジュールで実行し続けるプロセス内スケジューラ。
+    - ジョブは1つずつ順番に実行するため、同じジョブや別のジョブが重なって動くことはありません
+    - 停止中に過ぎた予定時刻は catchup_window 以内であれば起動後に1回だけ実行します（複数回分はまとめます）
+    - SIGINT / SIGTERM を受けると実行中のジョブの完了を待ってから終了します
+    - ロックファイルで同じデータディレクトリに対するデーモンの多重起動を防ぎます
+    """
+    def __init__(self, state_file=SCHEDULER_STATE_FILE, lock_file=SCHEDULER_LOCK_FILE,
+                 catchup_window=timedelta(hours=3), poll_interval=60):
+        self.state_file = state_file
+        self.lock_file = lock_file
+        self.catchup_window = catchup_window
+        self.poll_interval = poll_interval
+        self.jobs = []
+        self.stop_event = threading.Event()
+        self._lock_fd = None
+
+    def add_job(self, name, times, func):
+        job = ScheduledJob(name, times, func)
+        self.jobs.append(job)
+        return job
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        for job in self.jobs:
+            if job.name in state:
+                job.last_run = datetime.fromisoformat(state[job.name])
+
+    def save_state(self):
+        state = {job.name: job.last_run.isoformat() for job in self.jobs if job.last_run}
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def acquire_lock(self):
+        """デーモンのロックを取得します。既に別のデーモンが動いていれば False を返します。"""
+        try:
+            import fcntl
+        except ImportError:
+            # fcntl のない環境（Windows）では多重起動チェックを行わない
+            return True
+        directory = os.path.dirname(self.lock_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_fd = open(self.lock_file, "w")
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_fd.close()
+            self._lock_fd = None
+            return False
+        self._lock_fd.write(str(os.getpid()))
+        self._lock_fd.flush()
+        return True
+
+    def release_lock(self):
+        if self._lock_fd is not None:
+            self._lock_fd.close()
+            self._lock_fd = None
+
+    def stop(self, *_):
+        if not self.stop_event.is_set():
+            print("🛑 停止要求を受け付けました。実行中のジョブが終わり次第終了します。")
+        self.stop_event.set()
+
+    def pending_jobs(self, now):
+        """実行すべきジョブ（未実行の予定時刻が catchup_window 以内にあるもの）を返します。"""
+        pending = []
+        for job in self.jobs:
+            due = job.latest_due(now)
+            if due is None or now - due > self.catchup_window:
+                continue
+            if job.last_run is None or job.last_run < due:
+                pending.append(job)
+        return pending
+
+    def run_job(self, job):
+        started = datetime.now(TOKYO)
+        print(f"▶️ {started:%Y-%m-%d %H:%M} ジョブ {job.name} を開始します。")
+        try:
+            job.func()
+        except Exception as e:
+            # 1回の失敗でデーモン全体を止めない
+            print(f"❌ ジョブ {job.name} が失敗しました: {e}")
+        job.last_run = started
+        self.save_state()
+
+    def run(self):
+        if not self.acquire_lock():
+            print(f"❌ 別のデーモンが実行中です（{self.lock_file}）。")
+            return False
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.load_state()
+        print("🕘 スケジューラを開始しました: " + ", ".join(
+            f"{job.name}({' '.join(f'{h:02d}:{m:02d}' for h, m in job.times)})" for job in self.jobs))
+        try:
+            while not self.stop_event.is_set():
+                for job in self.pending_jobs(datetime.now(TOKYO)):
+                    if self.stop_event.is_set():
+                        break
+                    self.run_job(job)
+                now = datetime.now(TOKYO)
+                next_due = min(job.next_due(now) for job in self.jobs)
+                wait_seconds = min(self.poll_interval, max(1.0, (next_due - now).total_seconds()))
+                self.stop_event.wait(wait_seconds)
+        finally:
+            self.release_lock()
+        print("👋 スケジューラを終了しました。")
+        return True
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from src.instrumentation import Tracer
+
+SLACK_API_BASE_URL = os.environ.get("SLACK_API_BASE_URL", "https://slack.com/api")
+STREAMING_NOTICE = "⏳ 続きを生成中です…"  # ストリーミング投稿の生成途中の版に付ける表示
+STREAM_ERROR_NOTICE = "⚠️ 生成が途中で中断されたため、ここまでの内容のみを掲載しています。"
+# 再送すると同じメッセージが二重に投稿されうるメソッド（確実に未送信とわかる失敗とレート制限のみ再試行する）
+NON_IDEMPOTENT_METHODS = {"chat.postMessage"}
+
+def is_unsent_error(error):
+    """リクエストを送る前（接続の確立時）に失敗したことが確実な通信エラーなら True を返します。"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or isinstance(error, requests.ReadTimeout):
+        return False
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+@dataclass
+class DeliveryResult:
+    """1チャンネル分の投稿結果。"""
+    channel: str
+    ok: bool
+    ts: str = None
+    error: str = None
+    attempts: int = 0
+
+
+class SlackClient:
+    """
+    Slack へのメッセージ投稿をまとめて扱うクラス。
+    keep-alive セッションを使い回し、複数チャンネルへ並列に投稿します。
+    HTTP 429（および ratelimited エラー）では Retry-After に従って待機し、
+    5xx や通信エラーはジッター付きの指数バックオフで再試行します。
+    ただし chat.postMessage は、5xx や読み取りタイムアウトでも投稿済みの場合があるため、
+    レート制限と接続前の通信エラーのときだけ再試行します（二重投稿を防ぐため）。
+    """
+    def __init__(self, bot_token, channel_ids, base_url=SLACK_API_BASE_URL,
+                 max_retries=4, backoff_base=1.0, backoff_max=30.0, timeout=10, tracer=None):
+        self.bot_token = bot_token
+        self.tracer = tracer or Tracer()
+        self.channel_ids = list(channel_ids)
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        pool_size = max(1, len(self.channel_ids))
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.bot_token}",
+            "Content-Type": "application/json; charset=utf-8",
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after) + random.uniform(0, self.backoff_base)
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, method, payload):
+        """
+        Web API メソッドを呼び出し、(レスポンスの JSON, 試行回数) を返します。
+        再試行しても成功しなかった場合は {"ok": False, "error": ...} を返します。
+        """
+        with self.tracer.stage(f"slack.{method}", channel=payload.get("channel")) as event:
+            event["bytes"] = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            data, attempts = self._call(method, payload)
+            event["retries"] = attempts - 1
+            event["ok"] = bool(data.get("ok"))
+            if not data.get("ok"):
+                event["error"] = data.get("error")
+        return data, attempts
+
+    def _call(self, method, payload):
+        url = f"{self.base_url}/{method}"
+        idempotent = method not in NON_IDEMPOTENT_METHODS
+        data = {"ok": False, "error": "not_attempted"}
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After", "1")
+                    data = {"ok": False, "error": "ratelimited"}
+                elif response.status_code >= 500:
+                    data = {"ok": False, "error": f"http_{response.status_code}"}
+                    if not idempotent:
+                        return data, attempt + 1
+                else:
+                    data = response.json()
+                    if data.get("ok") or data.get("error") != "ratelimited":
+                        return data, attempt + 1
+                    retry_after = response.headers.get("Retry-After", "1")
+            except (requests.RequestException, ValueError) as e:
+                data = {"ok": False, "error": str(e)}
+                if not idempotent and not is_unsent_error(e):
+                    return data, attempt + 1
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        return data, self.max_retries + 1
+
+    def post_to_channel(self, channel, message):
+        payload = {
+            "channel": channel,
+            "text": message,
+            "unfurl_links": False,
+            "unfurl_media": False,
+        }
+        data, attempts = self.call("chat.postMessage", payload)
+        return DeliveryResult(channel=channel, ok=bool(data.get("ok")), ts=data.get("ts"),
+                              error=data.get("error"), attempts=attempts)
+
+    def update_in_channel(self, channel, ts, message):
+        """chat.update で投稿済みのメッセージを書き換えます。"""
+        data, attempts = self.call("chat.update", {"channel": channel, "ts": ts, "text": message})
+        return DeliveryResult(channel=channel, ok=bool(data.get("ok")), ts=data.get("ts", ts),
+                              error=data.get("error"), attempts=attempts)
+
+    def start_progressive(self, message, label="メッセージ", min_interval=1.0):
+        """
+        全チャンネルにプレースホルダーを投稿し、その場で書き換えていく ProgressiveMessage を返します。
+        """
+        progressive = ProgressiveMessage(self, label=label, min_interval=min_interval)
+        progressive.start(message)
+        return progressive
+
+    def post_stream(self, pieces, render_partial, render_final, label="メッセージ", min_interval=1.0,
+                    render_error=None):
+        """
+        生成中のテキスト断片 pieces を連結しながら Slack に段階的に投稿します。
+        render_partial(連結済みテキスト) が None 以外を返した時点でプレースホルダーを投稿し、以降はその場で書き換え、
+        最後に render_final(全文) の内容に揃えます。(全文, DeliveryResult のリスト) を返します。
+        プレースホルダーの投稿後に pieces が例外を送出した場合は、render_error(それまでのテキスト)
+        （省略時は中断の旨を付けた render_final）の内容に書き換えてから例外を送出し直します。
+        """
+        text = ""
+        progressive = None
+        try:
+            for piece in pieces:
+                text += piece
+                partial = render_partial(text)
+                if partial is None:
+                    continue
+                if progressive is None:
+                    progressive = self.start_progressive(partial, label=label, min_interval=min_interval)
+                else:
+                    progressive.update(partial)
+        except BaseException:
+            # 「生成中」の表示のまま残さないよう、ここまでの内容で確定させる
+            if progressive is not None:
+                if render_error is None:
+                    error_message = render_final(f"{text.rstrip()}\n\n{STREAM_ERROR_NOTICE}")
+                else:
+                    error_message = render_error(text)
+                progressive.finish(error_message)
+            raise
+        final_message = render_final(text)
+        if progressive is None:
+            return text, self.post_message(final_message, label=label)
+        return text, progressive.finish(final_message)
+
+    def post_message(self, message, label="メッセージ"):
+        """
+        全チャンネルへ並列に投稿し、チャンネルごとの DeliveryResult のリストを
+        channel_ids と同じ順序で返します。
+        """
+        today_date = datetime.now().strftime("%Y-%m-%d")
+        with ThreadPoolExecutor(max_workers=max(1, len(self.channel_ids))) as executor:
+            results = list(executor.map(lambda ch: self.post_to_channel(ch, message), self.channel_ids))
+        for result in results:
+            if result.ok:
+                print(f"✅ {today_date} に Slack へ{label}を投稿しました！(チャンネル: {result.channel})")
+            else:
+                print(f"❌ Slack への投稿に失敗しました: {result.error} "
+                      f"(チャンネル: {result.channel}, 試行回数: {result.attempts})")
+        return results
+
+
+class ProgressiveMessage:
+    """
+    生成途中のテキストを Slack に先に投稿し、chat.update で順次書き換えるためのクラス。
+    書き換えは min_interval 秒に1回までに間引き（レート制限対策）、finish() で必ず最終版に揃えます。
+    プレースホルダーの投稿に失敗したチャンネルには、finish() で最終版を新規投稿します。
+    """
+    def __init__(self, client, label="メッセージ", min_interval=1.0):
+        self.client = client
+        self.label = label
+        self.min_interval = min_interval
+        self.targets = {}       # チャンネル ID → 投稿済みメッセージの ts
+        self.last_text = None
+        self.last_update = 0.0
+
+    def start(self, message):
+        results = self.client.post_message(message, label=self.label)
+        self.targets = {r.channel: r.ts for r in results if r.ok and r.ts}
+        self.last_text = message
+        self.last_update = time.monotonic()
+        return results
+
+    def update(self, message, force=False):
+        """テキストが変わっていて前回の書き換えから min_interval 秒以上経っていれば書き換えます。"""
+        if message == self.last_text:
+            return []
+        if not force and time.monotonic() - self.last_update < self.min_interval:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, len(self.targets))) as executor:
+            results = list(executor.map(lambda item: self.client.update_in_channel(item[0], item[1], message),
+                                        self.targets.items()))
+        self.last_text = message
+        self.last_update = time.monotonic()
+        for result in results:
+            if not result.ok:
+                print(f"⚠️ Slack のメッセージ更新に失敗しました: {result.error} (チャンネル: {result.channel})")
+        return results
+
+    def finish(self, message):
+        """最終版のテキストに書き換えます。プレースホルダーがないチャンネルには新規投稿します。"""
+        results = self.update(message, force=True)
+        for channel in self.client.channel_ids:
+            if channel not in self.targets:
+                results.append(self.client.post_to_channel(channel, message))
+        today_date = datetime.now().strftime("%Y-%m-%d")
+        for result in results:
+            if result.ok:
+                print(f"✅ {today_date} に Slack の{self.label}を最終版に更新しました！(チャンネル: {result.channel})")
+        return results
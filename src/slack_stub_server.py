@@ -0,0 +1,110 @@
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class SlackStubServer:
+    """
+    Slack Web API（chat.postMessage / chat.update）のローカル代替サーバー。
+    オフラインで SlackClient の並列投稿やレート制限時の挙動を確認するためのものです。
+
+    - latency: 各リクエストの応答までの待ち時間（秒）
+    - rate_limit_every: N 件ごとに HTTP 429（Retry-After 付き）を返す（0 なら返さない）
+    - retry_after: 429 応答に付ける Retry-After（秒）
+    - fail_channels: 常に channel_not_found を返すチャンネル ID
+    - failure_rate: この割合で HTTP 500 を返す（0.0～1.0）
+
+    使用例:
+        with SlackStubServer(rate_limit_every=3) as server:
+            client = SlackClient("xoxb-test", ["C1", "C2"], base_url=server.url)
+            client.post_message("hello")
+            print(server.messages)
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0,
+                 rate_limit_every=0, retry_after=1, fail_channels=(), failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.fail_channels = set(fail_channels)
+        self.messages = []          # 受理したメッセージ（payload に ts を加えたもの。chat.update で text が更新される）
+        self.update_count = 0
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def _handle(self, method, payload):
+        """(HTTP ステータス, 追加ヘッダー, レスポンス JSON) を返します。"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.request_count += 1
+            if self.failure_rate and random.random() < self.failure_rate:
+                return 500, {}, {"ok": False, "error": "internal_error"}
+            if self.rate_limit_every and self.request_count % self.rate_limit_every == 0:
+                self.rate_limited_count += 1
+                return 429, {"Retry-After": str(self.retry_after)}, {"ok": False, "error": "ratelimited"}
+            channel = payload.get("channel")
+            if channel in self.fail_channels:
+                return 200, {}, {"ok": False, "error": "channel_not_found"}
+            if method == "chat.postMessage":
+                ts = f"{time.time():.6f}"
+                self.messages.append({**payload, "ts": ts})
+                return 200, {}, {"ok": True, "channel": channel, "ts": ts}
+            if method == "chat.update":
+                for message in self.messages:
+                    if message["channel"] == channel and message["ts"] == payload.get("ts"):
+                        message["text"] = payload.get("text")
+                        self.update_count += 1
+                        return 200, {}, {"ok": True, "channel": channel, "ts": message["ts"]}
+                return 200, {}, {"ok": False, "error": "message_not_found"}
+            return 200, {}, {"ok": False, "error": "unknown_method"}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    payload = {}
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                status, headers, body = server._handle(method, payload)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
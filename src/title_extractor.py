@@ -0,0 +1,120 @@
+import re
+import html
+import time
+import codecs
+from dataclasses import dataclass
+
+TITLE_MAX_BYTES = 64 * 1024  # タイトルが見つからなくても、ここまで読んだら打ち切る
+TITLE_CHUNK_SIZE = 4096
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+TITLE_RE = re.compile(rb"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+# タイトルがこれ以降に現れることはない位置（</title> はタイトルの終わり、</head>・<body> は head の終わり）
+HEAD_END_RE = re.compile(rb"</title\s*>|</head\s*>|<body[\s>]", re.IGNORECASE)
+META_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([a-zA-Z0-9_\-]+)", re.IGNORECASE)
+HEADER_CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?([a-zA-Z0-9_\-]+)", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+# 日本語サイトでよく使われる文字コード名 → Python のコーデック名
+# （Shift_JIS と表記していても実際は Windows の拡張文字を含むことが多いため cp932 で読む）
+CHARSET_ALIASES = {
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "sjis": "cp932",
+    "x-sjis": "cp932",
+    "windows-31j": "cp932",
+    "ms_kanji": "cp932",
+    "x-euc-jp": "euc_jp",
+    "euc-jp": "euc_jp",
+}
+# 文字コードの指定がない（または指定どおりに読めない）場合に候補とする日本語のコーデック
+JAPANESE_CHARSETS = ("cp932", "euc_jp")
+# 誤った文字コードで復号した日本語に現れやすい文字（半角カナ・私用領域）
+MOJIBAKE_RE = re.compile("[\uff61-\uff9f\ue000-\uf8ff]")
+
+@dataclass
+class PageTitle:
+    """read_title の結果。title は見つからなかった場合 None。"""
+    title: str = None
+    bytes_read: int = 0
+    content_type: str = ""
+    skipped: bool = False  # HTML 以外のため本文を読まなかった場合 True
+    truncated: bool = False  # 締め切りのため head の終わりまで読まずに打ち切った場合 True
+
+def is_html(content_type):
+    """Content-Type が HTML（または未指定）なら True を返します。"""
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return not media_type or media_type in HTML_CONTENT_TYPES
+
+def normalize_charset(name):
+    """文字コード名を Python のコーデック名に揃えます。不明な名前なら None を返します。"""
+    if not name:
+        return None
+    name = name.strip().lower()
+    name = CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def decode_title(raw, charsets):
+    """
+    charsets（宣言された文字コード）、UTF-8 の順に試して厳密に復号できたものを返します。
+    どれも失敗した場合は cp932 と EUC-JP のうち文字化けらしい文字が少ない方を選び、
+    それも失敗すれば UTF-8 で置換しながら復号します。
+    """
+    for charset in [*charsets, "utf-8"]:
+        if not charset:
+            continue
+        try:
+            return raw.decode(charset)
+        except UnicodeDecodeError:
+            continue
+    candidates = []
+    for charset in JAPANESE_CHARSETS:
+        try:
+            candidates.append(raw.decode(charset))
+        except UnicodeDecodeError:
+            continue
+    if candidates:
+        return min(candidates, key=lambda text: len(MOJIBAKE_RE.findall(text)))
+    return raw.decode("utf-8", errors="replace")
+
+def read_title(response, max_bytes=TITLE_MAX_BYTES, chunk_size=TITLE_CHUNK_SIZE, deadline=None):
+    """
+    stream=True で取得した応答の本文を chunk_size ずつ読み、<title> を取り出します。
+    </title>・</head>・<body> のいずれかが現れた時点、または max_bytes を読んだ時点で読むのをやめ、
+    HTML 以外の Content-Type は本文を読まずに返します。
+    deadline（time.monotonic() の値）を過ぎた場合も、それまでに読んだ分で打ち切ります。
+    文字コードは Content-Type ヘッダー、<meta charset>、UTF-8・cp932（Shift_JIS）・EUC-JP の順に判定します。
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if not is_html(content_type):
+        return PageTitle(content_type=content_type, skipped=True)
+
+    buffer = b""
+    truncated = False
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        # 終了タグがチャンクの境目をまたいでも見つかるよう、直前のチャンクの末尾から探す
+        search_from = max(0, len(buffer) - 16)
+        buffer += chunk
+        if HEAD_END_RE.search(buffer, search_from) or len(buffer) >= max_bytes:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            truncated = True
+            break
+    buffer = buffer[:max_bytes]
+
+    match = TITLE_RE.search(buffer)
+    if not match:
+        return PageTitle(bytes_read=len(buffer), content_type=content_type, truncated=truncated)
+    header_charset = HEADER_CHARSET_RE.search(content_type)
+    meta_charset = META_CHARSET_RE.search(buffer)
+    charsets = [
+        normalize_charset(header_charset.group(1)) if header_charset else None,
+        normalize_charset(meta_charset.group(1).decode("ascii")) if meta_charset else None,
+    ]
+    title = WHITESPACE_RE.sub(" ", html.unescape(decode_title(match.group(1), charsets))).strip()
+    return PageTitle(title=title or None, bytes_read=len(buffer), content_type=content_type)